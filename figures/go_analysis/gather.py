@@ -1,43 +1,162 @@
+import hashlib
+import os
+from pathlib import Path
+
 import pandas as pd
+import polars as pl
+import typer
+
+app = typer.Typer(context_settings={"help_option_names": ["-h", "--help"]})
+
+COLUMNS = ["Term", "PValue", "Genes"]
+
+
+def discover_samples(data_dir: Path, pattern: str = "**/*.txt") -> dict[str, Path]:
+    """
+    Find DAVID functional annotation charts under ``data_dir``.
+
+    A file is a chart if its header has the Term, PValue and Genes columns. The sample
+    name is its path relative to ``data_dir`` without the suffix, so a layout like
+    ``<condition>/<sample>.txt`` gives ``condition/sample``.
+    """
+    samples = {}
+    for path in sorted(data_dir.glob(pattern)):
+        with open(path) as f:
+            header = f.readline().rstrip("\r\n").split("\t")
+        if all(column in header for column in COLUMNS):
+            samples[path.relative_to(data_dir).with_suffix("").as_posix()] = path
+    return samples
 
 
-def gather(samples: list[str]) -> pd.DataFrame:
-    datasets = []
-
-    for sample in samples:
-        df = pd.read_table(f"./{sample}.txt")
-        df = df.loc[:, ["Term", "PValue", "Genes"]]
-        df["Sample"] = sample
-        datasets.append(df)
-
-    df = pd.concat(datasets)
-    df = df.query("PValue < 0.05")
-    df = df.reindex(
-        columns=[
-            "Sample",
-            "Term",
-            "Genes",
-            "PValue",
-        ]
+def scan_david(path: Path) -> pl.LazyFrame:
+    """Lazily scan the Term, PValue and Genes columns of a DAVID chart, keeping the row number."""
+    return (
+        pl.scan_csv(path, separator="\t", quote_char=None, infer_schema=False)
+        .with_row_index("row")
+        .select("row", "Term", pl.col("PValue").cast(pl.Float64), "Genes")
     )
 
-    # sort p-value among sample groups
-    df = df.sort_values(["Sample", "PValue"])
-    return df
 
+def cached_scan_david(path: Path, cache_dir: Path) -> pl.LazyFrame:
+    """
+    ``scan_david`` backed by a Parquet copy in ``cache_dir``.
 
-def main():
-    samples = ["HCT116", "A549", "HepG2", "VCaP004"]
-    df = gather(samples)
+    Entries are keyed by path, size and mtime, so an edited chart gets a new entry
+    and the filter is still pushed down into the Parquet scan.
+    """
+    stat = path.stat()
+    key = hashlib.blake2b(
+        f"{path.resolve()}\0{stat.st_size}\0{stat.st_mtime_ns}".encode(), digest_size=16
+    ).hexdigest()
+    table = cache_dir / f"{key}.parquet"
+    if not table.exists():
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp = table.with_suffix(f".parquet.{os.getpid()}.tmp")
+        scan_david(path).sink_parquet(tmp)
+        os.replace(tmp, table)
+    return pl.scan_parquet(table)
 
-    print(df)
-    styler = df.style
 
+def scan_gathered(
+    samples: list[str] | dict[str, Path],
+    pvalue: float = 0.05,
+    cache_dir: Path | None = None,
+    data_dir: Path = Path("."),
+) -> pl.LazyFrame:
+    """
+    Significant GO terms of every sample, sorted by sample and p-value.
+
+    ``samples`` maps sample names to DAVID charts (see ``discover_samples``); a list
+    of names reads ``<data_dir>/<sample>.txt``. The charts are scanned lazily and
+    concatenated into one query, so polars reads them in parallel and only rows with
+    ``PValue < pvalue`` are materialized. ``row`` is the row number in the chart.
+    """
+    if not isinstance(samples, dict):
+        samples = {sample: data_dir / f"{sample}.txt" for sample in samples}
+
+    frames = [
+        (scan_david(path) if cache_dir is None else cached_scan_david(path, cache_dir))
+        .filter(pl.col("PValue") < pvalue)
+        .with_columns(pl.lit(sample).alias("Sample"))
+        for sample, path in samples.items()
+    ]
+    if not frames:
+        raise ValueError("No DAVID charts to gather")
+
+    return (
+        pl.concat(frames)
+        .select("row", "Sample", "Term", "Genes", "PValue")
+        # sort p-value among sample groups
+        .sort(["Sample", "PValue"], maintain_order=True)
+    )
+
+
+def gather(
+    samples: list[str] | dict[str, Path],
+    pvalue: float = 0.05,
+    cache_dir: Path | None = None,
+    data_dir: Path = Path("."),
+) -> pd.DataFrame:
+    """``scan_gathered`` collected into pandas, indexed by the row number in each chart."""
+    df = scan_gathered(samples, pvalue, cache_dir, data_dir).collect().to_pandas()
+    return df.set_index("row").rename_axis(None)
+
+
+def to_latex(df: pd.DataFrame) -> str:
+    styler = df.style
     styler.format({"PValue": "{:.2e}"})
-    latex = styler.to_latex(siunitx=True)
+    return styler.to_latex(siunitx=True)
+
 
-    print(latex)
+def _write_columnar(df: pl.DataFrame, output: Path):
+    if output.suffix in (".arrow", ".ipc", ".feather"):
+        df.write_ipc(output)
+    elif output.suffix == ".tsv":
+        df.write_csv(output, separator="\t")
+    else:
+        df.write_parquet(output)
+
+
+@app.command()
+def main(
+    data_dir: Path = typer.Option(
+        Path("."), "--data-dir", "-d", exists=True, file_okay=False, help="Directory with DAVID charts"
+    ),
+    pattern: str = typer.Option("**/*.txt", "--pattern", help="Glob for chart files"),
+    sample: list[str] = typer.Option(
+        [], "--sample", "-s", help="Only gather these samples (default: every chart found)"
+    ),
+    pvalue: float = typer.Option(0.05, "--pvalue", "-p", help="Keep terms with PValue below this"),
+    cache_dir: Path | None = typer.Option(
+        None, "--cache-dir", help="Cache parsed charts as Parquet in this directory"
+    ),
+    latex: Path | None = typer.Option(
+        None, "--latex", help="Write the LaTeX table here instead of printing it"
+    ),
+    output: Path | None = typer.Option(
+        None, "--output", "-o", help="Also write the table as Parquet (.arrow/.ipc for IPC, .tsv)"
+    ),
+):
+    """Gather significant GO terms of DAVID charts into a LaTeX table and a columnar file."""
+    samples = discover_samples(data_dir, pattern)
+    if sample:
+        missing = [name for name in sample if name not in samples]
+        if missing:
+            raise typer.BadParameter(f"no DAVID chart for {', '.join(missing)} in {data_dir}")
+        samples = {name: samples[name] for name in sample}
+
+    gathered = scan_gathered(samples, pvalue, cache_dir).collect()
+    if output is not None:
+        _write_columnar(gathered, output)
+
+    df = gathered.to_pandas().set_index("row").rename_axis(None)
+    print(df)
+    table = to_latex(df)
+    if latex is None:
+        print(table)
+    else:
+        latex.write_text(table)
 
 
 if __name__ == "__main__":
-    main()
+    app()
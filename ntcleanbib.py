@@ -10,6 +10,12 @@ With minor tweeks from João Lourenço <joao.lourenco@fct.unl.pt>
 """
 
 import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import time
 
 # What to replace (original, replacement)
 utf8replacement = [
@@ -22,130 +28,284 @@ utf8replacement = [
     (" &", " \&"),
 ]
 
-parser = argparse.ArgumentParser(
-    description="Cleanup BibTeX files exported from Mendeley (or Zotero?!)."
-)
-parser.add_argument(
-    "--input",
-    "-i",
-    dest="inFile",
-    type=argparse.FileType("r"),
-    default="-",
-    help="The input file. Defaults to STDIN (keyboard)",
-)
-parser.add_argument(
-    "--output",
-    "-o",
-    dest="outFile",
-    type=argparse.FileType("w"),
-    default="-",
-    help="The output file. Defaults to STDOUT (screen)",
-)
-parser.add_argument(
-    "--fix-keys",
-    "-k",
-    dest="fixKeys",
-    default=False,
-    action="store_true",
-    help='fix keys: replace "(" and ")" with "_". Defaults to False',
-)
-
-args = parser.parse_args()
-
-
-fl = args.inFile.readlines()
-
-for i in range(len(fl)):
-    for invalid, valid in utf8replacement:
-        fl[i] = fl[i].replace(invalid, valid)
-
-
-def erase(string, iterator):
-    a = len(iterator)
-    i = 0
-    while i <= a - 1:
-        if string in iterator[i]:
-            del iterator[i]
-            a = len(iterator)
-        i += 1
-    return iterator
-
-
-fl = erase("month =", fl)
-fl = erase("note =", fl)
-fl = erase("annote =", fl)
-fl = erase("keywords =", fl)
-fl = erase("file =", fl)
-fl = erase("annote =", fl)
-fl = erase("url =", fl)
-fl = erase("abstract =", fl)
-fl = erase("issn =", fl)
-
-
-# CLEANING (SPECIAL HANDLING EXTRA LINES)
-if True:
-    a = len(fl)
-    i = 0
-    while i <= a - 1:
-        if (
-            (" = {" in fl[i])
-            or ("@" in fl[i])
-            or (fl[i] == "} ")
-            or (fl[i] == "}")
-            or (fl[i] == "}\n")
-        ):
-            i += 1
-            pass
+# Lines containing any of these are dropped, one pass per pattern in this order
+erased_fields = [
+    "month =",
+    "note =",
+    "annote =",
+    "keywords =",
+    "file =",
+    "annote =",
+    "url =",
+    "abstract =",
+    "issn =",
+]
+
+# No replacement produces the start of another pattern, so one alternation applied
+# left to right gives the same result as applying the replacements one after another
+_replacements = dict(utf8replacement)
+_replace_re = re.compile("|".join(map(re.escape, _replacements)))
+_erase_re = re.compile("|".join(map(re.escape, dict.fromkeys(erased_fields))))
+
+
+def clean_lines(lines, skip=None):
+    """
+    Clean BibTeX lines in a single streaming pass.
+
+    Equivalent to the former whole-file passes: replacements, then one erase pass per
+    entry of ``erased_fields``, then dropping lines that are neither a field, an entry
+    header nor a closing brace, then stripping ``https://doi.org/`` from DOI fields.
+
+    An erase pass deleted from a list while moving forward, so the line after a
+    deleted one was never checked by that pass. ``skip`` keeps that per-pass state
+    (one flag per pattern) and is updated in place, so a file can be cleaned in
+    pieces and give the same output.
+    """
+    if skip is None:
+        skip = [False] * len(erased_fields)
+    for line in lines:
+        line = _replace_re.sub(lambda m: _replacements[m.group()], line)
+
+        if _erase_re.search(line) is None:
+            # kept by every pass, which also ends any pass's skip
+            if any(skip):
+                skip[:] = [False] * len(skip)
         else:
-            del fl[i]
-            a = len(fl)
-#####################################
+            erased = False
+            for k, pattern in enumerate(erased_fields):
+                if skip[k]:
+                    skip[k] = False
+                elif pattern in line:
+                    skip[k] = erased = True
+                    break
+            if erased:
+                continue
 
+        if not (" = {" in line or "@" in line or line in ("} ", "}", "}\n")):
+            continue
 
-# DOI HANDLING
-if True:
-    for i in range(len(fl)):
-        if "https://doi.org/" in fl[i] and "doi =" in fl[i]:
-            fl[i] = fl[i].replace("https://doi.org/", "")
-#####################################
+        if "https://doi.org/" in line and "doi =" in line:
+            line = line.replace("https://doi.org/", "")
+        yield line
 
 
-# CHECK FOR DUPLICATE KEYS
-if True:
-    keys = []
-    duplicates = []
-    badsymbols = []
-    for i in range(len(fl)):
-        if "@" in fl[i]:
-            key = fl[i].split("{")[1].split(",")[0]
-            if key not in keys:
-                keys.append((key, i))
-            else:
-                duplicates.append((key, i))
-            if "(" in key or ")" in key:
-                if args.fixKeys:
-                    fl[i] = fl[i].replace("(", "_").replace(")", "_")
+def check_keys(lines, fix_keys=False, duplicates=None, badsymbols=None):
+    """
+    Pass cleaned lines through, recording duplicate and bad keys as ``(key, line)``.
+
+    Entry keys containing "(" or ")" are fixed with "_" if ``fix_keys`` is set and
+    reported in ``badsymbols`` otherwise. Line numbers count output lines from 0.
+    """
+    keys = {}
+    for i, line in enumerate(lines):
+        if "@" in line and "{" in line:
+            key = line.split("{")[1].split(",")[0]
+            # only entry headers define keys; "@" may also appear inside a field
+            if line.lstrip().startswith("@") and duplicates is not None:
+                if key in keys:
+                    duplicates.append((key, i))
                 else:
+                    keys[key] = i
+            if "(" in key or ")" in key:
+                if fix_keys:
+                    line = line.replace("(", "_").replace(")", "_")
+                elif badsymbols is not None:
                     badsymbols.append((key, i))
-    if len(duplicates) != 0:
-        print("Warning! Duplicates found (key, line):")
-        print(duplicates)
-        print("")
-    if len(badsymbols) != 0:
+        yield line
+
+
+def report_keys(duplicates, badsymbols, file=sys.stderr):
+    if duplicates:
+        print("Warning! Duplicates found (key, line):", file=file)
+        print(duplicates, file=file)
+        print("", file=file)
+    if badsymbols:
         print(
-            "Warning! '(' or ')' symbols found (key, line) — Use option '-k' to replace them with '_':"
+            "Warning! '(' or ')' symbols found (key, line) — Use option '-k' to replace them with '_':",
+            file=file,
         )
-        print(badsymbols)
-        print("")
+        print(badsymbols, file=file)
+        print("", file=file)
+
+
+# Changing the rules above invalidates cached entries
+_rules_hash = hashlib.blake2b(
+    repr((utf8replacement, erased_fields)).encode(), digest_size=8
+).hexdigest()
+
+
+def split_entries(lines):
+    """Group lines into chunks starting at entry headers; the first may be a preamble."""
+    chunk = []
+    for line in lines:
+        if chunk and line.lstrip().startswith("@"):
+            yield chunk
+            chunk = []
+        chunk.append(line)
+    if chunk:
+        yield chunk
+
+
+class EntryCache:
+    """
+    Cleaned entries keyed by a hash of their raw text and the erase state before them.
+
+    ``clean`` gives the same lines as ``clean_lines`` but only re-cleans entries whose
+    text (or incoming state) was not seen in the previous run. ``save`` writes the
+    entries used in the last run to the JSON sidecar ``path``, dropping the rest.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.entries = {}
+        self.used = {}
+        self.hits = self.misses = 0
+        if path is not None and os.path.exists(path):
+            with open(path, encoding="utf8") as f:
+                data = json.load(f)
+            if data.get("rules") == _rules_hash:
+                self.entries = data["entries"]
+
+    def clean(self, lines):
+        self.hits = self.misses = 0
+        skip = [False] * len(erased_fields)
+        for chunk in split_entries(lines):
+            state = "".join("1" if flag else "0" for flag in skip)
+            key = hashlib.blake2b(
+                (state + "\0" + "".join(chunk)).encode(), digest_size=16
+            ).hexdigest()
+            cached = self.used.get(key) or self.entries.get(key)
+            if cached is None:
+                self.misses += 1
+                cleaned = list(clean_lines(chunk, skip))
+                cached = [cleaned, "".join("1" if flag else "0" for flag in skip)]
+            else:
+                self.hits += 1
+                skip[:] = [flag == "1" for flag in cached[1]]
+            self.used[key] = cached
+            yield from cached[0]
+
+    def save(self):
+        self.entries, self.used = self.used, {}
+        if self.path is None:
+            return
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf8") as f:
+            json.dump({"rules": _rules_hash, "entries": self.entries}, f)
+        os.replace(tmp, self.path)
+
+
+def rebuild(in_path, out_path, cache, fix_keys=False):
+    """Clean ``in_path`` into ``out_path`` (replaced atomically) through ``cache``."""
+    duplicates = []
+    badsymbols = []
+    tmp = f"{out_path}.{os.getpid()}.tmp"
+    with open(in_path) as src, open(tmp, "w") as dst:
+        dst.writelines(check_keys(cache.clean(src), fix_keys, duplicates, badsymbols))
+    os.replace(tmp, out_path)
+    cache.save()
+    report_keys(duplicates, badsymbols)
+
+
+def watch(in_path, out_path, cache, fix_keys=False, interval=1.0):
+    """Rebuild whenever the input's mtime changes, until interrupted."""
+    last = None
+    try:
+        while True:
+            try:
+                mtime = os.stat(in_path).st_mtime_ns
+            except FileNotFoundError:
+                # reference managers may delete and recreate the export
+                mtime = None
+            if mtime is not None and mtime != last:
+                last = mtime
+                rebuild(in_path, out_path, cache, fix_keys)
+                print(
+                    f"{time.strftime('%H:%M:%S')} {out_path}: "
+                    f"{cache.misses} of {cache.hits + cache.misses} entries re-cleaned",
+                    file=sys.stderr,
+                )
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Cleanup BibTeX files exported from Mendeley (or Zotero?!)."
+    )
+    parser.add_argument(
+        "--input",
+        "-i",
+        dest="inFile",
+        type=argparse.FileType("r"),
+        default="-",
+        help="The input file. Defaults to STDIN (keyboard)",
+    )
+    parser.add_argument(
+        "--output",
+        "-o",
+        dest="outFile",
+        type=argparse.FileType("w"),
+        default="-",
+        help="The output file. Defaults to STDOUT (screen)",
+    )
+    parser.add_argument(
+        "--fix-keys",
+        "-k",
+        dest="fixKeys",
+        default=False,
+        action="store_true",
+        help='fix keys: replace "(" and ")" with "_". Defaults to False',
+    )
+    parser.add_argument(
+        "--cache",
+        "-c",
+        dest="cacheFile",
+        default=None,
+        help="Incremental mode: keep cleaned entries in this JSON file and only "
+        "re-clean new or changed entries",
+    )
+    parser.add_argument(
+        "--watch",
+        "-w",
+        default=False,
+        action="store_true",
+        help="Rebuild the output whenever the input changes (needs --input and --output files)",
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=1.0,
+        help="Seconds between checks in watch mode. Defaults to 1",
+    )
+
+    args = parser.parse_args()
+
+    if args.watch:
+        if args.inFile is sys.stdin or args.outFile is sys.stdout:
+            parser.error("--watch needs --input and --output files")
+        args.inFile.close()
+        args.outFile.close()
+        cache = EntryCache(args.cacheFile)
+        watch(args.inFile.name, args.outFile.name, cache, args.fixKeys, args.interval)
+        return
+
+    if args.cacheFile is not None:
+        cache = EntryCache(args.cacheFile)
+        lines = cache.clean(args.inFile)
     else:
-        del duplicates
-#####################################
+        cache = None
+        lines = clean_lines(args.inFile)
+
+    duplicates = []
+    badsymbols = []
+    args.outFile.writelines(check_keys(lines, args.fixKeys, duplicates, badsymbols))
+    args.outFile.flush()
+    if cache is not None:
+        cache.save()
+    report_keys(duplicates, badsymbols)
 
-# try:
-#     f = open(args.outFile, "w", encoding="utf8")
-# except Exception as e:
-#     print (e)
-#     sys.exit()
 
-for element in fl:
-    args.outFile.write(element)
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+# /// script
+# requires-python = ">=3.10"
+# dependencies = [
+#     "typer",
+#     "numpy",
+#     "pysam",
+#     "pyfastx",
+#     "polars",
+#     "matplotlib",
+#     "rich",
+# ]
+# ///
+"""
+Benchmarks for the QC scripts on deterministic synthetic data.
+
+    python scripts/bench.py generate bench_data --reads 100000
+    python scripts/bench.py run bench_data -o results.json --baseline baseline.json
+"""
+
+import json
+import os
+import subprocess
+import sys
+import time
+import numpy as np
+import typer
+from pathlib import Path
+
+app = typer.Typer(context_settings={"help_option_names": ["-h", "--help"]})
+
+CLI = Path(__file__).with_name("cli.py")
+BASES = np.frombuffer(b"ACGT", dtype=np.uint8)
+CONTIGS = [(f"chr{i}", 50_000_000) for i in range(1, 11)]
+
+# read kinds as produced by DeepChopper: untouched, terminal adapter trimmed, internal adapter split
+PLAIN, TERMINAL, INTERNAL = 0, 1, 2
+
+
+def _read_ids(n_reads: int, seed: int):
+    """UUID read ids and kinds shared by the FASTQ and BAM generators."""
+    rng = np.random.default_rng(seed)
+    raw = rng.integers(0, 256, size=(n_reads, 16), dtype=np.uint8)
+    kinds = rng.choice([PLAIN, TERMINAL, INTERNAL], size=n_reads, p=[0.8, 0.15, 0.05])
+    ids = []
+    for row in raw:
+        h = row.tobytes().hex()
+        ids.append(f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}")
+    return ids, kinds
+
+
+def _fastq_record(rng, name: str, length: int) -> bytes:
+    seq = BASES[rng.integers(0, 4, size=length)].tobytes()
+    qual = (rng.integers(5, 41, size=length, dtype=np.uint8) + 33).tobytes()
+    return b"@" + name.encode() + b"\n" + seq + b"\n+\n" + qual + b"\n"
+
+
+def generate_fastq(path: Path, n_reads: int, read_len: int = 1000, seed: int = 0):
+    """
+    DeepChopper-style output FASTQ: reads split at an internal adapter become two
+    records ``<uuid>|I|0`` and ``<uuid>|I|1``, trimmed reads are ``<uuid>|T``.
+    """
+    ids, kinds = _read_ids(n_reads, seed)
+    rng = np.random.default_rng(seed + 1)
+    lengths = np.maximum(50, rng.normal(read_len, read_len / 4, size=n_reads).astype(int))
+    n_records = 0
+    with open(path, "wb") as f:
+        for name, kind, length in zip(ids, kinds, lengths):
+            if kind == INTERNAL:
+                cut = int(length) // 2
+                f.write(_fastq_record(rng, f"{name}|I|0", cut))
+                f.write(_fastq_record(rng, f"{name}|I|1", int(length) - cut))
+                n_records += 2
+            else:
+                suffix = "|T" if kind == TERMINAL else ""
+                f.write(_fastq_record(rng, f"{name}{suffix}", int(length)))
+                n_records += 1
+    return n_records
+
+
+def generate_bam(path: Path, n_reads: int, read_len: int = 1000, seed: int = 0):
+    """
+    Coordinate-sorted, indexed BAM of the reads before chopping.
+
+    Most reads with an internal adapter and a few others are chimeric: their
+    primary and supplementary alignments both carry an ``SA`` tag.
+    """
+    import pysam
+
+    ids, kinds = _read_ids(n_reads, seed)
+    rng = np.random.default_rng(seed + 2)
+    chimeric = np.where(kinds == INTERNAL, rng.random(n_reads) < 0.8, rng.random(n_reads) < 0.02)
+
+    # one alignment per read plus a supplementary one for chimeras
+    read_idx = np.concatenate([np.arange(n_reads), np.flatnonzero(chimeric)])
+    supplementary = np.r_[np.zeros(n_reads, bool), np.ones(chimeric.sum(), bool)]
+    contig = rng.integers(0, len(CONTIGS), size=len(read_idx))
+    pos = rng.integers(0, CONTIGS[0][1] - read_len, size=len(read_idx))
+    order = np.lexsort((pos, contig))
+
+    header = {
+        "HD": {"VN": "1.6", "SO": "coordinate"},
+        "SQ": [{"SN": name, "LN": length} for name, length in CONTIGS],
+    }
+    with pysam.AlignmentFile(path, "wb", header=header) as out:
+        for i in order:
+            r = read_idx[i]
+            a = pysam.AlignedSegment(out.header)
+            a.query_name = ids[r]
+            a.flag = 2048 if supplementary[i] else 0
+            a.reference_id = int(contig[i])
+            a.reference_start = int(pos[i])
+            a.mapping_quality = 60
+            a.cigarstring = f"{read_len}M"
+            if chimeric[r]:
+                a.set_tag("SA", f"chr1,{int(pos[i]) + 1},+,{read_len}M,60,0;")
+            out.write(a)
+    pysam.index(str(path))
+    return len(read_idx)
+
+
+def generate_gtf(path: Path, n_genes: int, seed: int = 0):
+    """Ensembl-style GTF with gene, transcript, exon and UTR features."""
+    rng = np.random.default_rng(seed + 3)
+    biotypes = ["protein_coding", "lncRNA", "miRNA", "processed_pseudogene"]
+    n_rows = 0
+    with open(path, "w") as f:
+        f.write("#!genome-build synthetic\n")
+        for g in range(n_genes):
+            chrom = CONTIGS[g % len(CONTIGS)][0]
+            strand = "+" if rng.random() < 0.5 else "-"
+            biotype = biotypes[rng.integers(0, len(biotypes))]
+            gene_start = int(rng.integers(1, 40_000_000))
+            attrs = f'gene_id "G{g:08d}"; gene_name "GENE{g}"; gene_biotype "{biotype}";'
+            exon_spans = []
+            cursor = gene_start
+            for _ in range(int(rng.integers(1, 12))):
+                start = cursor + int(rng.integers(50, 5000))
+                end = start + int(rng.integers(50, 1500))
+                exon_spans.append((start, end))
+                cursor = end
+            gene_end = cursor
+            f.write(f"{chrom}\tsyn\tgene\t{gene_start}\t{gene_end}\t.\t{strand}\t.\t{attrs}\n")
+            n_rows += 1
+            for t in range(int(rng.integers(1, 5))):
+                tattrs = f'{attrs} transcript_id "T{g:08d}.{t}";'
+                f.write(f"{chrom}\tsyn\ttranscript\t{gene_start}\t{gene_end}\t.\t{strand}\t.\t{tattrs}\n")
+                n_rows += 1
+                for e, (start, end) in enumerate(exon_spans):
+                    if rng.random() < 0.2 and len(exon_spans) > 1:
+                        continue
+                    f.write(f"{chrom}\tsyn\texon\t{start}\t{end}\t.\t{strand}\t.\t{tattrs}\n")
+                    n_rows += 1
+                    if e == 0:
+                        utr_end = min(end, start + 100)
+                        f.write(
+                            f"{chrom}\tsyn\tfive_prime_utr\t{start}\t{utr_end}\t.\t{strand}\t.\t{tattrs}\n"
+                        )
+                        n_rows += 1
+    return n_rows
+
+
+def generate_long_reads(
+    fastq_path: Path, regions_path: Path, n_reads: int, read_len: int = 20_000, seed: int = 0
+):
+    """Long reads with one or two adapter regions each, plus the regions TSV for vis-batch."""
+    rng = np.random.default_rng(seed + 4)
+    ids, _kinds = _read_ids(n_reads, seed + 5)
+    with open(fastq_path, "wb") as fq, open(regions_path, "w") as regions:
+        regions.write("read_id\tstart\tend\n")
+        for name in ids:
+            fq.write(_fastq_record(rng, name, read_len))
+            for _ in range(int(rng.integers(1, 3))):
+                start = int(rng.integers(0, read_len - 100))
+                regions.write(f"{name}\t{start}\t{start + int(rng.integers(20, 100))}\n")
+    return n_reads
+
+
+@app.command()
+def generate(
+    data_dir: Path = typer.Argument(..., help="Directory for the synthetic inputs"),
+    reads: int = typer.Option(100_000, "--reads", "-n", help="Reads before chopping (1k-10M)"),
+    read_len: int = typer.Option(1000, "--read-len", help="Mean read length"),
+    long_reads: int = typer.Option(20, "--long-reads", help="Reads for the visualization benchmark"),
+    seed: int = typer.Option(0, "--seed"),
+):
+    """Generate deterministic synthetic FASTQ, BAM, GTF and long-read inputs."""
+    data_dir.mkdir(parents=True, exist_ok=True)
+    manifest = {"reads": reads, "read_len": read_len, "seed": seed}
+
+    t0 = time.perf_counter()
+    manifest["fastq_records"] = generate_fastq(data_dir / "chopped.fq", reads, read_len, seed)
+    typer.echo(f"FASTQ: {manifest['fastq_records']} records ({time.perf_counter() - t0:.1f}s)")
+
+    t0 = time.perf_counter()
+    manifest["bam_records"] = generate_bam(data_dir / "before.bam", reads, read_len, seed)
+    typer.echo(f"BAM: {manifest['bam_records']} alignments ({time.perf_counter() - t0:.1f}s)")
+
+    t0 = time.perf_counter()
+    manifest["gtf_rows"] = generate_gtf(data_dir / "annotation.gtf", max(100, reads // 10), seed)
+    typer.echo(f"GTF: {manifest['gtf_rows']} rows ({time.perf_counter() - t0:.1f}s)")
+
+    manifest["long_reads"] = generate_long_reads(
+        data_dir / "long.fq", data_dir / "long_regions.tsv", long_reads, seed=seed
+    )
+    (data_dir / "manifest.json").write_text(json.dumps(manifest, indent=2))
+
+
+def _benchmarks(data_dir: Path, workers: int, manifest: dict):
+    """(name, cli arguments, records processed) for every benchmarked command."""
+    out = data_dir / "out"
+    fq, bam = data_dir / "chopped.fq", data_dir / "before.bam"
+    n_fq, n_bam = manifest["fastq_records"], manifest["bam_records"]
+    return [
+        ("cal-internal", ["cal-internal", fq], n_fq),
+        (f"cal-internal-w{workers}", ["cal-internal", fq, "-w", workers], n_fq),
+        # pinned to the BAM scan: an existing before.bam.names.npy would be used otherwise
+        ("ratio", ["ratio", bam, fq, "--no-name-index"], n_fq + n_bam),
+        (f"ratio-w{workers}", ["ratio", bam, fq, "-w", workers, "--no-name-index"], n_fq + n_bam),
+        ("name-index", ["name-index", bam, "-t", workers], n_bam),
+        # needs the index built by the name-index benchmark (see `run`)
+        ("ratio-indexed", ["ratio", bam, fq, "--name-index"], n_fq),
+        ("merge-fastq", ["merge-fastq", fq, fq, out / "merged.fq.gz", "-t", workers], 2 * n_fq),
+        (
+            "merge-fastq-copy",
+            ["merge-fastq", fq, fq, out / "copied.fq.gz", "--copy", "-t", workers],
+            2 * n_fq,
+        ),
+        (
+            "transcript-len",
+            ["transcript-len", data_dir / "annotation.gtf", "-b", "all", "-o", out / "tlen"],
+            manifest["gtf_rows"],
+        ),
+        (
+            "vis-batch",
+            [
+                "vis-batch", data_dir / "long.fq", data_dir / "long_regions.tsv",
+                "-o", out / "vis", "-w", workers, "--force", "--glyph-letters",
+            ],
+            manifest["long_reads"],
+        ),
+    ]
+
+
+def _measure(args):
+    """Run a command; return wall time in seconds and the child's peak RSS in MiB."""
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(args, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    stderr = proc.stderr.read()
+    _pid, status, rusage = os.wait4(proc.pid, 0)
+    wall = time.perf_counter() - t0
+    if os.waitstatus_to_exitcode(status) != 0:
+        raise RuntimeError(f"{' '.join(args)} failed:\n{stderr.decode(errors='replace')}")
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return wall, rusage.ru_maxrss * scale / 2**20
+
+
+@app.command()
+def run(
+    data_dir: Path = typer.Argument(..., exists=True, help="Directory made by `generate`"),
+    output: Path | None = typer.Option(None, "--output", "-o", help="Write results as JSON"),
+    baseline: Path | None = typer.Option(
+        None, "--baseline", "-b", help="Results JSON to compare against"
+    ),
+    tolerance: float = typer.Option(
+        0.2, "--tolerance", help="Allowed relative slowdown / memory growth vs the baseline"
+    ),
+    workers: int = typer.Option(4, "--workers", "-w", help="Workers for the parallel variants"),
+    only: list[str] = typer.Option([], "--only", help="Run only these benchmarks"),
+):
+    """
+    Run every command on the synthetic data and record wall time, throughput and peak RSS.
+
+    Exits non-zero if a benchmark is slower or uses more memory than the baseline allows.
+    """
+    manifest = json.loads((data_dir / "manifest.json").read_text())
+    (data_dir / "out").mkdir(exist_ok=True)
+
+    benchmarks = [b for b in _benchmarks(data_dir, workers, manifest) if not only or b[0] in only]
+    names = [name for name, _args, _records in benchmarks]
+    if "ratio-indexed" in names and "name-index" not in names:
+        # build the index untimed so ratio-indexed never falls back to a BAM scan
+        _measure([sys.executable, str(CLI), "name-index", str(data_dir / "before.bam")])
+
+    results = []
+    for name, cli_args, records in benchmarks:
+        wall, rss = _measure([sys.executable, str(CLI), *map(str, cli_args)])
+        results.append(
+            {
+                "name": name,
+                "reads": manifest["reads"],
+                "records": records,
+                "wall_s": round(wall, 3),
+                "records_per_s": round(records / wall, 1),
+                "peak_rss_mb": round(rss, 1),
+            }
+        )
+        typer.echo(
+            f"{name:<22}{wall:>9.2f} s{records / wall:>14,.0f} rec/s{rss:>10.0f} MiB"
+        )
+
+    if output:
+        output.write_text(json.dumps(results, indent=2))
+
+    if baseline:
+        reference = {r["name"]: r for r in json.loads(baseline.read_text())}
+        regressions = []
+        for r in results:
+            ref = reference.get(r["name"])
+            if ref is None or ref["reads"] != r["reads"]:
+                continue
+            for key in ("wall_s", "peak_rss_mb"):
+                if r[key] > ref[key] * (1 + tolerance):
+                    regressions.append(f"{r['name']}: {key} {ref[key]} -> {r[key]}")
+        if regressions:
+            typer.echo("Regressions against baseline:\n  " + "\n  ".join(regressions), err=True)
+            raise typer.Exit(1)
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,116 @@
+# /// script
+# requires-python = ">=3.10"
+# dependencies = [
+#     "typer",
+#     "pyfastx",
+#     "pysam",
+#     "numpy",
+#     "polars",
+#     "matplotlib",
+#     "rich",
+# ]
+# ///
+"""
+Single entry point for the QC scripts.
+
+Only the standard library is imported at startup; a subcommand's script (and with it
+typer, pysam, pyfastx, polars or matplotlib) is imported only when that subcommand runs.
+
+    python scripts/cli.py cal-internal reads.fq.gz -w 8
+    python scripts/cli.py startup
+"""
+
+import importlib
+import subprocess
+import sys
+import time
+
+# command -> (script module, typer command name or None for single-command apps, summary)
+COMMANDS = {
+    "cal-internal": ("cal_internal", "cal-internal", "Count internal adapters in a FASTQ file"),
+    "ratio": ("cal_internal", "ratio", "Ratio of chimeric reads with internal adapters"),
+    "name-index": ("cal_internal", "name-index", "Build the read-name index used by ratio"),
+    "merge-fastq": ("merge_fq", None, "Merge FASTQ files into one BGZF FASTQ"),
+    "transcript-len": ("transcipt_len", None, "Transcript lengths from a GTF file"),
+    "vis-batch": ("vis_seq_qual", "batch", "Render sequence/quality figures for many reads"),
+    "vis-example": ("vis_seq_qual", "example", "Render the example sequence/quality figure"),
+}
+
+PROG = "cli.py"
+# cold start of ``COMMAND --help``; eagerly importing matplotlib or polars alone breaks it
+STARTUP_BUDGET_MS = 1000
+
+
+def usage():
+    width = max(map(len, COMMANDS))
+    lines = [f"Usage: {PROG} COMMAND [ARGS]...", "", "Commands:"]
+    lines += [f"  {name:<{width}}  {summary}" for name, (_m, _c, summary) in COMMANDS.items()]
+    lines.append(f"  {'startup':<{width}}  Measure cold-start time of every command")
+    lines += ["", f"Run '{PROG} COMMAND --help' for the options of a command."]
+    return "\n".join(lines)
+
+
+def run(command, args):
+    """Import the script behind ``command`` and hand the remaining arguments to its typer app."""
+    module_name, typer_command, _summary = COMMANDS[command]
+    module = importlib.import_module(module_name)
+    if typer_command is None:
+        return module.app(args=list(args), prog_name=f"{PROG} {command}")
+    # multi-command apps print "<prog_name> <typer_command>" in their usage line
+    return module.app(args=[typer_command, *args], prog_name=PROG)
+
+
+def startup(args):
+    """
+    Measure the cold-start time of each command as the best of N runs of ``COMMAND --help``.
+
+    Usage: startup [--repeat N] [--budget-ms MS]; exits non-zero if a command exceeds the
+    budget (default ``STARTUP_BUDGET_MS``, 0 to only report).
+    """
+    repeat, budget_ms = 3, STARTUP_BUDGET_MS
+    it = iter(args)
+    for arg in it:
+        if arg == "--repeat":
+            repeat = int(next(it))
+        elif arg == "--budget-ms":
+            budget_ms = float(next(it))
+        else:
+            raise SystemExit(f"Unknown option for startup: {arg}\n{startup.__doc__}")
+
+    def best_ms(cmd):
+        times = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+            times.append((time.perf_counter() - t0) * 1000)
+        return min(times)
+
+    print(f"{'python (baseline)':<20}{best_ms([sys.executable, '-c', 'pass']):>9.0f} ms")
+    over_budget = []
+    for command in COMMANDS:
+        ms = best_ms([sys.executable, __file__, command, "--help"])
+        flag = ""
+        if budget_ms and ms > budget_ms:
+            over_budget.append(command)
+            flag = "  over budget"
+        print(f"{command:<20}{ms:>9.0f} ms{flag}")
+
+    if over_budget:
+        raise SystemExit(f"Over the {budget_ms:.0f} ms budget: {', '.join(over_budget)}")
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] in ("-h", "--help"):
+        print(usage())
+        return
+    command, args = argv[0], argv[1:]
+    if command == "startup":
+        return startup(args)
+    if command not in COMMANDS:
+        raise SystemExit(f"Unknown command: {command}\n\n{usage()}")
+    return run(command, args)
+
+
+if __name__ == "__main__":
+    main()
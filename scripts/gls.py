@@ -1,40 +1,192 @@
-import sys
-import pyperclip
+# /// script
+# requires-python = ">=3.10"
+# dependencies = [
+#     "typer",
+#     "pyperclip",
+# ]
+# ///
+"""
+Generate ``\\newacronym`` entries for glossaries-extra.
+
+    python scripts/gls.py journal_nbt/sn-article.tex -o journal_nbt/acronyms.tex
+    python scripts/gls.py "Oxford Nanopore Technologies (ONT), Gene Ontology (GO)"
+"""
+
+import os
+import re
+import typer
 from pathlib import Path
 
+app = typer.Typer(context_settings={"help_option_names": ["-h", "--help"]})
+
+# "Full Name (ABBR)": the "(ABBR)" part after a space; the full name is found in the text before it
+_ACRONYM_RE = re.compile(r"(?<=[ \t~])\(([A-Za-z][A-Za-z0-9-]{0,9})\)")
+# LaTeX syntax that cannot be part of a full name
+_NOT_PLAIN = "(){}[]\\$"
+_NEWACRONYM_RE = re.compile(r"\\newacronym(?:\[[^\]]*\])?\{([^}]*)\}\{([^}]*)\}")
+_INPUT_RE = re.compile(r"\\(?:input|include|subfile)\{([^}]+)\}")
+# "%" starts a comment unless escaped
+_COMMENT_RE = re.compile(r"(?<!\\)%.*")
+
+
+def newacronym(short: str, full: str) -> str:
+    return f"\\newacronym{{{short.lower()}}}{{{short}}}{{{full}}}"
+
+
+def long_form(words: str, short: str) -> str | None:
+    """
+    Shortest trailing part of ``words`` that spells ``short`` (Schwartz & Hearst, 2003).
+
+    The letters and digits of ``short`` must appear in order, the first one at the
+    start of a word; returns None if they do not.
+    """
+    chars = [c.lower() for c in short if c.isalnum()]
+    if not any(c.isupper() for c in short) or len(chars) < 2:
+        return None
+    words = " ".join(words.replace("~", " ").split())
+    # a long form has at most min(|A| + 5, 2|A|) words
+    words = " ".join(words.split(" ")[-min(len(chars) + 5, 2 * len(chars)) :])
+
+    i = len(words) - 1
+    for n, c in enumerate(reversed(chars)):
+        first = n == len(chars) - 1
+        while i >= 0 and (
+            words[i].lower() != c or (first and i > 0 and words[i - 1].isalnum())
+        ):
+            i -= 1
+        if i < 0:
+            return None
+        i -= 1
+    start = words.rfind(" ", 0, i + 1) + 1
+    full = words[start:]
+    return full if len(full) > len(short) else None
+
+
+def read_tex(path: Path, seen: set | None = None):
+    """Yield the lines of ``path`` without comments, following \\input/\\include."""
+    seen = set() if seen is None else seen
+    path = path.resolve()
+    if path in seen:
+        return
+    seen.add(path)
+    with open(path, encoding="utf8", errors="replace") as f:
+        for line in f:
+            line = _COMMENT_RE.sub("", line)
+            for name in _INPUT_RE.findall(line):
+                child = path.parent / name
+                if not child.suffix:
+                    child = child.with_suffix(".tex")
+                if child.exists():
+                    yield from read_tex(child, seen)
+            yield line
+
+
+def find_acronyms(lines) -> dict[str, tuple[str, str]]:
+    """Map lowercase key to ``(short, full)`` for every "Full Name (ABBR)" in ``lines``."""
+    found = {}
+    for line in lines:
+        if "(" not in line:
+            continue
+        for m in _ACRONYM_RE.finditer(line):
+            words = line[max(0, m.start() - 200) : m.start()]
+            cut = max(words.rfind(c) for c in _NOT_PLAIN)
+            full = long_form(words[cut + 1 :], m.group(1))
+            if full is not None:
+                found.setdefault(m.group(1).lower(), (m.group(1), full))
+    return found
+
+
+def defined_acronyms(lines) -> set[str]:
+    """Keys and short forms (lowercase) of the \\newacronym entries in ``lines``."""
+    defined = set()
+    for line in lines:
+        for key, short in _NEWACRONYM_RE.findall(line):
+            defined.add(key.lower())
+            defined.add(short.lower())
+    return defined
+
+
+def parse_pairs(text: str) -> dict[str, tuple[str, str]]:
+    """Parse a comma-separated "Full Name (ABBR), ..." argument; raises ValueError on other items."""
+    pairs = {}
+    for item in text.split(","):
+        if not item.strip():
+            continue
+        full, paren, short = item.rpartition("(")
+        short = short.strip().strip(")").strip()
+        if not paren or not full.strip() or not short:
+            raise ValueError(f'expected "Full Name (ABBR)", got {item.strip()!r}')
+        pairs.setdefault(short.lower(), (short, full.strip()))
+    return pairs
+
+
+def _looks_like_path(source: str) -> bool:
+    """A missing .tex file or directory, rather than a "Full Name (ABBR)" string."""
+    if "(" in source:
+        return False
+    return source.endswith(".tex") or "/" in source or os.sep in source
 
-def worker(text, file):
-    content = []
-    if text is not None:
-        items = text.split(",")
-        for item in items:
-            full, short = item.split("(")
-            full = full.strip()
-            short = short.strip(")")
-            short_lower = short.lower()
 
-            result = f"\\newacronym{{{short_lower}}}{{{short}}}{{{full}}}"
-            print(result)
-            content.append(result)
+@app.command()
+def main(
+    sources: list[str] = typer.Argument(
+        ...,
+        help='.tex files or directories to scan, or a "Full Name (ABBR), ..." string',
+    ),
+    output: Path | None = typer.Option(
+        None,
+        "--output",
+        "-o",
+        help="Glossary file to append new entries to (default: print them)",
+    ),
+    copy: bool = typer.Option(False, "--copy", help="Also copy the new entries to the clipboard"),
+):
+    """
+    Generate \\newacronym entries for every "Full Name (ABBR)" in LaTeX sources.
 
-        print("copying to clipboard...")
-        pyperclip.copy("\n".join(content))
+    Acronyms already defined with \\newacronym in the sources or in the output file are skipped.
+    """
+    lines = []
+    acronyms = {}
+    for source in sources:
+        path = Path(source)
+        if not path.exists():
+            if _looks_like_path(source):
+                raise typer.BadParameter(f"{source} does not exist", param_hint="SOURCES")
+            try:
+                pairs = parse_pairs(source)
+            except ValueError as e:
+                raise typer.BadParameter(f"{e} (or pass an existing .tex file)", param_hint="SOURCES")
+            acronyms.update((key, value) for key, value in pairs.items() if key not in acronyms)
+            continue
+        for tex in sorted(path.rglob("*.tex")) if path.is_dir() else [path]:
+            lines.extend(read_tex(tex))
+    for key, value in find_acronyms(lines).items():
+        acronyms.setdefault(key, value)
 
+    if output is not None and output.exists():
+        lines.extend(read_tex(output))
+    defined = defined_acronyms(lines)
 
-def main():
-    if len(sys.argv) == 1:
-        print("No arguments provided")
+    entries = [
+        newacronym(short, full)
+        for key, (short, full) in acronyms.items()
+        if key not in defined and short.lower() not in defined
+    ]
+    typer.echo(f"{len(entries)} new of {len(acronyms)} acronyms found", err=True)
+    if not entries:
+        return
 
-    elif len(sys.argv) == 2:
-        if Path(sys.argv[1]).exists():
-            worker(None, sys.argv[1])
-        else:
-            text = "".join(sys.argv[1:])
-            worker(text, None)
+    if output is None:
+        typer.echo("\n".join(entries))
+    else:
+        with open(output, "a", encoding="utf8") as f:
+            f.write("\n".join(entries) + "\n")
+    if copy:
+        import pyperclip
 
-    print("Exiting...")
-    raise SystemExit
+        pyperclip.copy("\n".join(entries))
 
 
 if __name__ == "__main__":
-    main()
+    app()
@@ -1,28 +1,404 @@
-import pyfastx
 import gzip
+import shutil
+import struct
+import tempfile
+import zlib
 import typer
-from rich.progress import track
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from enum import Enum
 
 from pathlib import Path
 
+from metrics import Metrics
+from reads import bgzf_blocks, is_bgzf, is_gzip, read_key
+
 app = typer.Typer(context_settings={"help_option_names": ["-h", "--help"]})
 
+# htslib keeps uncompressed blocks at 0xff00 so the deflated block always fits in 64 KiB
+BGZF_BLOCK_SIZE = 0xFF00
+BGZF_HEADER = bytes.fromhex("1f8b08040000000000ff060042430200")
+BGZF_EOF = bytes.fromhex("1f8b08040000000000ff0600424302001b0003000000000000000000")
+
+# 16-byte read id key plus the global ordinal of the record across all inputs
+_KEY_FIELDS = [("key", "S16"), ("ordinal", "<u8")]
+_N_BUCKETS = 64
+
+
+class Dedup(str, Enum):
+    none = "none"
+    first = "first"
+    last = "last"
+
+
+def _bgzf_block(data: bytes, level: int) -> bytes:
+    """Compress one chunk of at most ``BGZF_BLOCK_SIZE`` bytes into a BGZF block."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    deflated = compressor.compress(data) + compressor.flush()
+    if len(deflated) > 0x10000 - 26:
+        # incompressible data: store it, which only adds a few bytes of overhead
+        compressor = zlib.compressobj(0, zlib.DEFLATED, -15)
+        deflated = compressor.compress(data) + compressor.flush()
+    # gzip header with FEXTRA and the "BC" subfield holding the block size minus 1
+    header = BGZF_HEADER + struct.pack("<H", len(deflated) + 25)
+    return header + deflated + struct.pack("<II", zlib.crc32(data), len(data))
+
+
+class BgzfWriter:
+    """
+    Multithreaded BGZF writer.
+
+    Data is cut into independent gzip members of ``BGZF_BLOCK_SIZE`` bytes that
+    are deflated in a thread pool (``zlib`` releases the GIL) and written in
+    order. The result is a multi-member gzip file readable by any gzip reader,
+    and is also valid BGZF for ``samtools``/``tabix``/``pyfastx`` random access.
+    """
+
+    def __init__(self, path: Path, level: int = 6, threads: int = 4):
+        self._file = open(path, "wb")
+        self._level = level
+        self._buffer = bytearray()
+        self._pool = ThreadPoolExecutor(max_workers=max(1, threads))
+        self._pending = deque()
+        self._max_pending = 4 * max(1, threads)
+
+    def write(self, data: bytes):
+        self._buffer += data
+        n_full = len(self._buffer) - len(self._buffer) % BGZF_BLOCK_SIZE
+        if n_full:
+            with memoryview(self._buffer) as view:
+                for i in range(0, n_full, BGZF_BLOCK_SIZE):
+                    self._submit(bytes(view[i : i + BGZF_BLOCK_SIZE]))
+            del self._buffer[:n_full]
+
+    def flush(self):
+        """Compress the buffered tail as its own block and write every pending block."""
+        if self._buffer:
+            self._submit(bytes(self._buffer))
+            self._buffer.clear()
+        while self._pending:
+            self._file.write(self._pending.popleft().result())
+
+    def copy_members(self, src, buffer_size: int = 16 << 20):
+        """Append the BGZF blocks of ``src`` without recompressing (``src`` must be BGZF)."""
+        self.flush()
+        shutil.copyfileobj(src, self._file, buffer_size)
+
+    def _submit(self, chunk: bytes):
+        self._pending.append(self._pool.submit(_bgzf_block, chunk, self._level))
+        while len(self._pending) >= self._max_pending:
+            self._file.write(self._pending.popleft().result())
+
+    def close(self):
+        self.flush()
+        self._file.write(BGZF_EOF)
+        self._pool.shutdown()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _fastq_batches(fq_paths: list[Path], keep: bytes | None = None, batch_size: int = 10_000):
+    """
+    Yield the number of records and their encoded FASTQ text, ``batch_size`` records at a time.
+
+    ``keep`` is an optional bit mask over the global record ordinal (see
+    ``_dedup_mask``); records whose bit is not set are skipped.
+    """
+    import pyfastx
+    from rich.progress import track
+
+    batch = []
+    ordinal = 0
+    for fq_path in fq_paths:
+        fq_iter = pyfastx.Fastx(fq_path)
+        for name, seq, qual in track(fq_iter, description=f"Merging {fq_path.name}..."):
+            if keep is None or keep[ordinal >> 3] >> (ordinal & 7) & 1:
+                batch.append(f"@{name}\n{seq}\n+\n{qual}\n")
+            ordinal += 1
+            if len(batch) == batch_size:
+                yield len(batch), "".join(batch).encode()
+                batch.clear()
+    if batch:
+        yield len(batch), "".join(batch).encode()
+
+
+def _keep_ordinals(records: "np.ndarray", dedup: Dedup) -> "np.ndarray":
+    """Ordinals of the first or last record of every read id in ``records``."""
+    import numpy as np
+
+    records = np.sort(records, order=["key", "ordinal"])
+    keys = records["key"]
+    if dedup == Dedup.first:
+        boundary = np.r_[True, keys[1:] != keys[:-1]]
+    else:
+        boundary = np.r_[keys[1:] != keys[:-1], True]
+    return records["ordinal"][boundary]
+
+
+def _dedup_mask(
+    fq_paths: list[Path], dedup: Dedup, max_ids: int, batch_size: int = 100_000
+):
+    """
+    First pass of a deduplicating merge: decide which records to keep.
+
+    Read id keys are collected in memory until ``max_ids`` is crossed; after
+    that they are spilled to ``_N_BUCKETS`` temporary files partitioned by key,
+    so duplicates always land in the same bucket and each bucket is resolved on
+    its own. Returns a little-endian bit mask over record ordinals, the total
+    number of records and the number kept.
+    """
+    import numpy as np
+    import pyfastx
+    from rich.progress import track
+
+    key_dtype = np.dtype(_KEY_FIELDS)
+    in_memory = []
+    n_in_memory = 0
+    buckets = None
+    ordinal = 0
+
+    with tempfile.TemporaryDirectory(prefix="merge_fq_") as tmp_dir:
+
+        def spill(records):
+            first_key_byte = records.view(np.uint8).reshape(-1, key_dtype.itemsize)[:, 0]
+            bucket_of = first_key_byte % _N_BUCKETS
+            for b in np.unique(bucket_of):
+                buckets[b].write(records[bucket_of == b].tobytes())
+
+        def add_batch(keys):
+            nonlocal n_in_memory, buckets, ordinal
+            records = np.empty(len(keys), dtype=key_dtype)
+            records["key"] = np.frombuffer(b"".join(keys), dtype="S16")
+            records["ordinal"] = np.arange(ordinal, ordinal + len(keys))
+            ordinal += len(keys)
+
+            if buckets is None:
+                in_memory.append(records)
+                n_in_memory += len(records)
+                if n_in_memory <= max_ids:
+                    return
+                buckets = [
+                    open(f"{tmp_dir}/bucket_{b}.bin", "w+b") for b in range(_N_BUCKETS)
+                ]
+                records = np.concatenate(in_memory)
+                in_memory.clear()
+            spill(records)
+
+        keys = []
+        for fq_path in fq_paths:
+            fq_iter = pyfastx.Fastx(fq_path)
+            for name, _seq, _qual in track(fq_iter, description=f"Indexing {fq_path.name}..."):
+                keys.append(read_key(name))
+                if len(keys) == batch_size:
+                    add_batch(keys)
+                    keys.clear()
+        if keys:
+            add_batch(keys)
+
+        mask = np.zeros((ordinal + 7) // 8, dtype=np.uint8)
+
+        def mark(records):
+            kept = _keep_ordinals(records, dedup)
+            np.bitwise_or.at(mask, kept >> 3, (1 << (kept & 7)).astype(np.uint8))
+            return len(kept)
+
+        if buckets is None:
+            n_kept = mark(np.concatenate(in_memory)) if in_memory else 0
+        else:
+            n_kept = 0
+            for f in buckets:
+                f.seek(0)
+                n_kept += mark(np.frombuffer(f.read(), dtype=key_dtype))
+                f.close()
+
+    return mask.tobytes(), ordinal, n_kept
+
+
+def _validate_fastq(fq_path: Path):
+    """
+    Light sanity check of a FASTQ file before it is copied byte for byte.
+
+    Checks that the first record has the 4-line FASTQ layout. Gzipped files are
+    also fully decompressed, which verifies every member's CRC at C speed without
+    parsing records. A missing final newline is not an error: ``_copy_fastq``
+    adds it.
+    """
+    gzipped = is_gzip(fq_path)
+    opener = gzip.open if gzipped else open
+    try:
+        with opener(fq_path, "rb") as f:
+            head = [f.readline() for _ in range(4)]
+            if gzipped:
+                while f.read(16 << 20):
+                    pass
+    except (OSError, EOFError) as e:
+        raise ValueError(f"{fq_path} is not a valid gzip file: {e}") from e
+
+    header, seq, plus, qual = (line.rstrip(b"\r\n") for line in head)
+    if not header.startswith(b"@") or not plus.startswith(b"+") or len(seq) != len(qual):
+        raise ValueError(f"{fq_path} does not look like a 4-line FASTQ file")
+
+
+def _bgzf_last_byte(fq_path: Path) -> bytes:
+    """
+    Last uncompressed byte of a BGZF file, from its last non-empty block.
+
+    Raises ValueError if any member is not a BGZF block.
+    """
+    blocks = bgzf_blocks(fq_path)
+    if not blocks:
+        return b""
+    with open(fq_path, "rb") as f:
+        f.seek(blocks[-1][0])
+        header = f.read(18)
+        (bsize,) = struct.unpack_from("<H", header, 16)
+        block = header + f.read(bsize + 1 - len(header))
+    return gzip.decompress(block)[-1:]
+
+
+def _copy_fastq(fq_path: Path, out_f: BgzfWriter, buffer_size: int = 16 << 20):
+    """
+    Append a FASTQ file to the output without parsing it.
+
+    BGZF inputs are copied block by block without recompressing. Plain inputs,
+    and gzip inputs that are not BGZF throughout, are streamed in large chunks
+    through the BGZF compressor. A missing final newline is added in both
+    cases, so the next file's first record stays separate.
+    """
+    if is_bgzf(fq_path):
+        try:
+            last = _bgzf_last_byte(fq_path)
+        except ValueError:
+            last = None
+        if last is not None:
+            with open(fq_path, "rb") as src:
+                out_f.copy_members(src, buffer_size)
+            if last not in (b"", b"\n"):
+                out_f.write(b"\n")
+            return
+
+    opener = gzip.open if is_gzip(fq_path) else open
+    with opener(fq_path, "rb") as src:
+        last = b"\n"
+        while chunk := src.read(buffer_size):
+            out_f.write(chunk)
+            last = chunk[-1:]
+        if last != b"\n":
+            out_f.write(b"\n")
+
+
+def _check_output(fq_paths: list[Path], output_fq_gz: Path):
+    """
+    Refuse an output path that would clobber an input.
+
+    The output is truncated before any input is read, so it must not be one of
+    the inputs. It is always gzipped, so an existing uncompressed FASTQ at that
+    path is taken to be a misplaced input rather than a previous result.
+    """
+    if not output_fq_gz.exists():
+        return
+    for fq_path in fq_paths:
+        if fq_path.exists() and fq_path.samefile(output_fq_gz):
+            raise typer.BadParameter(f"output {output_fq_gz} is also an input")
+    if output_fq_gz.is_file() and not is_gzip(output_fq_gz):
+        with open(output_fq_gz, "rb") as f:
+            if f.read(1) == b"@":
+                raise typer.BadParameter(
+                    f"output {output_fq_gz} is an existing uncompressed FASTQ, not overwriting it"
+                )
+
 
 @app.command()
 def merge_fastq(
-    fastq1: Path,
-    fastq2: Path,
-    output_fq_gz: Path,
+    paths: list[Path] = typer.Argument(
+        ..., help="Input FASTQ files, followed by the output FASTQ.gz path unless --output is given"
+    ),
+    output: Path | None = typer.Option(
+        None, "--output", "-o", help="Output FASTQ.gz path; every positional argument is then an input"
+    ),
+    level: int = typer.Option(6, "--level", "-l", min=0, max=9, help="gzip compression level"),
+    threads: int = typer.Option(4, "--threads", "-t", min=1, help="Compression threads"),
+    copy: bool = typer.Option(
+        False,
+        "--copy",
+        help="Copy raw bytes without re-parsing records (BGZF inputs are not recompressed)",
+    ),
+    validate: bool = typer.Option(
+        False, "--validate", help="With --copy, sanity-check each input before copying"
+    ),
+    dedup: Dedup = typer.Option(
+        Dedup.none,
+        "--dedup",
+        "-d",
+        help="Drop duplicate read ids, keeping the first or the last copy",
+    ),
+    max_ids: int = typer.Option(
+        8_000_000,
+        "--max-ids",
+        help="With --dedup, read ids kept in memory before spilling to disk",
+    ),
+    metrics_json: Path | None = typer.Option(
+        None, "--metrics-json", help="Write runtime and peak-memory metrics as JSON ('-' for stderr)"
+    ),
+    profile: Path | None = typer.Option(
+        None, "--profile", help="Write a cProfile dump of the main process (pstats format)"
+    ),
 ):
     """
-    Merge two FASTQ files into one gzipped FASTQ file using pyfastx.
+    Merge FASTQ files into one gzipped FASTQ file using pyfastx.
+
+    The output is written as BGZF (block gzip) compressed in parallel, which any gzip reader can decompress.
+    With --copy, headers are kept verbatim (including comments) and BGZF inputs are not recompressed.
     """
-    typer.echo(f"Merging {fastq1} and {fastq2} into {output_fq_gz}...")
-    with gzip.open(output_fq_gz, "wt") as out_f:
-        for fq_path in [fastq1, fastq2]:
-            fq_iter = pyfastx.Fastx(fq_path)
-            for name, seq, qual in track(fq_iter, description="Merging FASTQ files..."):
-                out_f.write(f"@{name}\n{seq}\n+\n{qual}\n")
+    if output is not None:
+        fq_paths, output_fq_gz = paths, output
+    elif len(paths) < 3:
+        # two paths are ambiguous: a forgotten output would overwrite the second input
+        raise typer.BadParameter(
+            "expected at least two input FASTQs and the output path (use --output to merge a single input)"
+        )
+    else:
+        *fq_paths, output_fq_gz = paths
+    if copy and dedup != Dedup.none:
+        raise typer.BadParameter("--copy does not parse records and cannot be combined with --dedup")
+    _check_output(fq_paths, output_fq_gz)
+
+    typer.echo(f"Merging {', '.join(map(str, fq_paths))} into {output_fq_gz}...")
+    input_bytes = sum(fq_path.stat().st_size for fq_path in fq_paths)
+    with Metrics("merge-fastq", metrics_json, profile) as metrics:
+        if copy and validate:
+            with metrics.phase("validate") as phase:
+                for fq_path in fq_paths:
+                    try:
+                        _validate_fastq(fq_path)
+                    except ValueError as e:
+                        raise typer.BadParameter(str(e), param_hint="--validate")
+                phase.bytes = input_bytes
+
+        keep = None
+        if dedup != Dedup.none:
+            with metrics.phase("dedup_index") as phase:
+                keep, n_total, n_kept = _dedup_mask(fq_paths, dedup, max_ids)
+                phase.records = n_total
+            typer.echo(f"Dropping {n_total - n_kept} duplicate reads out of {n_total}")
+
+        with metrics.phase("write") as phase:
+            with BgzfWriter(output_fq_gz, level=level, threads=threads) as out_f:
+                if copy:
+                    for fq_path in fq_paths:
+                        _copy_fastq(fq_path, out_f)
+                else:
+                    phase.records = 0
+                    for n_records, batch in _fastq_batches(fq_paths, keep):
+                        out_f.write(batch)
+                        phase.records += n_records
+            phase.bytes = input_bytes
+        metrics.records = phase.records
 
 
 if __name__ == "__main__":
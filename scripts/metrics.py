@@ -0,0 +1,129 @@
+"""
+Runtime and peak-memory instrumentation shared by the QC scripts.
+
+Every command accepts ``--metrics-json PATH`` (``-`` for stderr) and ``--profile PATH``:
+
+    with Metrics("ratio", metrics_json, profile) as metrics:
+        with metrics.phase("read_fastq") as phase:
+            ...
+            phase.records = total_reads
+
+The report is a single JSON object per run (one line, so several runs can be
+collected as JSON Lines), and the profile is a cProfile dump of the main process
+readable by ``pstats``, snakeviz or gprof2dot. Worker processes are not profiled;
+attach ``py-spy record --subprocesses`` for those.
+"""
+
+import cProfile
+import json
+import resource
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+
+def peak_rss_mb(who: int = resource.RUSAGE_SELF) -> float:
+    """High-water resident set size in MiB of this process or (``RUSAGE_CHILDREN``) its largest child."""
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return round(resource.getrusage(who).ru_maxrss * scale / 2**20, 1)
+
+
+def _rate(amount, seconds):
+    return round(amount / seconds, 1) if seconds > 0 else None
+
+
+class Phase:
+    """Wall time of one phase, with optional record and byte counts set by the caller."""
+
+    def __init__(self, name: str, records: int | None = None):
+        self.name = name
+        self.records = records
+        self.bytes = None
+        self.wall_s = 0.0
+        self.peak_rss_mb = 0.0
+
+    def as_dict(self) -> dict:
+        d = {"name": self.name, "wall_s": round(self.wall_s, 4)}
+        if self.records is not None:
+            d["records"] = self.records
+            d["records_per_s"] = _rate(self.records, self.wall_s)
+        if self.bytes is not None:
+            d["bytes"] = self.bytes
+            d["mb_per_s"] = _rate(self.bytes / 2**20, self.wall_s)
+        d["peak_rss_mb"] = self.peak_rss_mb
+        return d
+
+
+class Metrics:
+    """
+    Collects per-phase timings of one command run and reports them on exit.
+
+    Without ``metrics_json`` or ``profile`` it only keeps a few timestamps, so
+    library functions can take an optional ``Metrics`` and call ``phase`` freely.
+    """
+
+    def __init__(
+        self,
+        command: str | None = None,
+        metrics_json: Path | None = None,
+        profile: Path | None = None,
+    ):
+        self.command = command
+        self.metrics_json = metrics_json
+        self.profile = profile
+        self.records = None
+        self.phases = []
+        self._profiler = None
+
+    @contextmanager
+    def phase(self, name: str, records: int | None = None):
+        phase = Phase(name, records)
+        t0 = time.perf_counter()
+        try:
+            yield phase
+        finally:
+            phase.wall_s = time.perf_counter() - t0
+            phase.peak_rss_mb = peak_rss_mb()
+            self.phases.append(phase)
+
+    def report(self, wall_s: float, status: str = "ok") -> dict:
+        d = {
+            "command": self.command,
+            "argv": sys.argv,
+            "started_at": self._started_at.isoformat(timespec="seconds"),
+            "status": status,
+            "wall_s": round(wall_s, 4),
+        }
+        if self.records is not None:
+            d["records"] = self.records
+            d["records_per_s"] = _rate(self.records, wall_s)
+        d["peak_rss_mb"] = peak_rss_mb()
+        d["peak_rss_children_mb"] = peak_rss_mb(resource.RUSAGE_CHILDREN)
+        d["phases"] = [p.as_dict() for p in self.phases]
+        if self.profile is not None:
+            d["profile"] = str(self.profile)
+        return d
+
+    def __enter__(self):
+        self._started_at = datetime.now(timezone.utc)
+        self._t0 = time.perf_counter()
+        if self.profile is not None:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall_s = time.perf_counter() - self._t0
+        if self._profiler is not None:
+            self._profiler.disable()
+            self._profiler.dump_stats(self.profile)
+        if self.metrics_json is not None:
+            line = json.dumps(self.report(wall_s, "ok" if exc_type is None else "error")) + "\n"
+            if str(self.metrics_json) == "-":
+                sys.stderr.write(line)
+            else:
+                Path(self.metrics_json).write_text(line)
+        return False
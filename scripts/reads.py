@@ -0,0 +1,63 @@
+"""
+Read-id keys and input format checks shared by the QC scripts.
+
+``read_key`` is used both for the ``ratio`` name index and the ``merge-fastq``
+deduplication, so the two always agree on what makes two read ids equal.
+"""
+
+import hashlib
+import os
+import re
+import struct
+from pathlib import Path
+
+UUID_RE = re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}")
+
+
+def read_key(name: str) -> bytes:
+    """16-byte key of a read id: the raw UUID for ONT ids, a BLAKE2 digest otherwise."""
+    if UUID_RE.fullmatch(name):
+        return bytes.fromhex(name.replace("-", ""))
+    return hashlib.blake2b(name.encode(), digest_size=16).digest()
+
+
+def is_gzip(path: Path) -> bool:
+    with open(path, "rb") as f:
+        return f.read(2) == b"\x1f\x8b"
+
+
+def is_bgzf(path: Path) -> bool:
+    """Check whether a file is BGZF compressed (gzip with a ``BC`` extra subfield)."""
+    with open(path, "rb") as f:
+        header = f.read(16)
+    return (
+        len(header) == 16
+        and header[:4] == b"\x1f\x8b\x08\x04"
+        and header[12:14] == b"BC"
+    )
+
+
+def bgzf_blocks(path: Path) -> list[tuple[int, int]]:
+    """
+    Return ``(compressed_offset, uncompressed_offset)`` for every non-empty BGZF block.
+
+    Walks the block headers (``BSIZE``/``ISIZE``) without decompressing; raises
+    ValueError at the first member that is not a BGZF block.
+    """
+    blocks = []
+    coffset = uoffset = 0
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        while coffset < size:
+            f.seek(coffset)
+            header = f.read(18)
+            if len(header) < 18 or header[:4] != b"\x1f\x8b\x08\x04" or header[12:14] != b"BC":
+                raise ValueError(f"{path} is not a valid BGZF file at offset {coffset}")
+            (bsize,) = struct.unpack_from("<H", header, 16)
+            f.seek(coffset + bsize + 1 - 4)
+            (isize,) = struct.unpack("<I", f.read(4))
+            if isize:
+                blocks.append((coffset, uoffset))
+            coffset += bsize + 1
+            uoffset += isize
+    return blocks
@@ -1,84 +1,252 @@
 # /// script
 # requires-python = ">=3.10"
 # dependencies = [
-#     "gtfparse",
-#     "numpy<2",
 #     "polars",
 #     "typer",
-#     "pandas",
 # ]
 # ///
 
+import hashlib
+import json
+import os
+import sys
 import typer
-from gtfparse import read_gtf
+from enum import Enum
 from pathlib import Path
-import polars as pl
+
+from metrics import Metrics
 
 app = typer.Typer(context_settings={"help_option_names": ["-h", "--help"]})
 
 
+class OutputFormat(str, Enum):
+    tsv = "tsv"
+    parquet = "parquet"
+
+
+# Features to include for transcript length
+EXONIC_FEATURES = ["exon", "five_prime_utr", "three_prime_utr", "3utr", "5utr"]
+
+
+def scan_gtf(gtf_file: Path, attributes: list[str]) -> "pl.LazyFrame":
+    """
+    Lazily scan a (optionally gzipped) GTF file.
+
+    Only the requested ``attributes`` are extracted from the attribute column, and
+    since nothing is read until ``collect``, polars pushes feature filters and
+    column projection down into the CSV scan.
+    """
+    import polars as pl
+
+    schema = {
+        "seqname": pl.String,
+        "source": pl.String,
+        "feature": pl.String,
+        "start": pl.Int64,
+        "end": pl.Int64,
+        "score": pl.String,
+        "strand": pl.String,
+        "frame": pl.String,
+        "attribute": pl.String,
+    }
+    lf = pl.scan_csv(
+        gtf_file,
+        separator="\t",
+        has_header=False,
+        schema=schema,
+        comment_prefix="#",
+        quote_char=None,
+    )
+    return lf.with_columns(
+        pl.col("attribute").str.extract(rf'(?:^|\s){name} "([^"]*)"', 1).alias(name)
+        for name in attributes
+    )
+
+
+def _gtf_fingerprint(gtf_file: Path, sample_size: int = 1 << 20) -> dict:
+    """
+    Identify a GTF by path, size, mtime and a content hash.
+
+    The hash covers the first and last ``sample_size`` bytes plus the size, which
+    catches re-exports and truncation without reading a multi-GB file each run.
+    """
+    stat = gtf_file.stat()
+    digest = hashlib.blake2b(digest_size=16)
+    with open(gtf_file, "rb") as f:
+        digest.update(f.read(sample_size))
+        f.seek(max(0, stat.st_size - sample_size))
+        digest.update(f.read(sample_size))
+    return {
+        "source": str(gtf_file.resolve()),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "content_hash": digest.hexdigest(),
+    }
+
+
+def cached_scan_gtf(
+    gtf_file: Path,
+    attributes: list[str],
+    cache_dir: Path,
+    refresh: bool = False,
+    metrics: Metrics | None = None,
+) -> "pl.LazyFrame":
+    """
+    ``scan_gtf`` backed by an Arrow IPC cache in ``cache_dir``.
+
+    The parsed table (all rows, the GTF columns used here and the requested
+    attributes) is written once as uncompressed IPC next to a JSON sidecar with
+    its fingerprint. Later runs scan the memory-mapped IPC file instead of
+    re-parsing the GTF. ``refresh`` rebuilds the entry, which is timed as the
+    ``cache_gtf`` phase of ``metrics``.
+    """
+    import polars as pl
+
+    metrics = metrics or Metrics()
+
+    fingerprint = _gtf_fingerprint(gtf_file)
+    fingerprint["attributes"] = sorted(attributes)
+    key = hashlib.blake2b(
+        json.dumps(fingerprint, sort_keys=True).encode(), digest_size=16
+    ).hexdigest()
+    table = cache_dir / f"{key}.arrow"
+    meta = cache_dir / f"{key}.json"
+
+    if refresh or not (table.exists() and meta.exists()):
+        with metrics.phase("cache_gtf") as phase:
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp = table.with_suffix(f".arrow.{os.getpid()}.tmp")
+            scan_gtf(gtf_file, attributes).drop(
+                "source", "score", "frame", "attribute"
+            ).sink_ipc(tmp)
+            os.replace(tmp, table)
+            meta.write_text(json.dumps(fingerprint, indent=2))
+            phase.bytes = fingerprint["size"]
+
+    return pl.scan_ipc(table)
+
+
+def prune_gtf_cache(cache_dir: Path) -> int:
+    """Remove cache entries whose source GTF is gone or changed; return how many were removed."""
+    removed = 0
+    for meta in cache_dir.glob("*.json"):
+        info = json.loads(meta.read_text())
+        source = Path(info["source"])
+        stale = not source.exists()
+        if not stale:
+            current = _gtf_fingerprint(source)
+            stale = any(info[k] != current[k] for k in ("size", "mtime_ns", "content_hash"))
+        if stale:
+            meta.with_suffix(".arrow").unlink(missing_ok=True)
+            meta.unlink()
+            removed += 1
+    for orphan in cache_dir.glob("*.tmp"):
+        orphan.unlink()
+    return removed
+
+
+def _write_table(df: "pl.DataFrame", output_file: Path | None, fmt: OutputFormat):
+    """Write a table as TSV or Parquet to a file, or to stdout when no file is given."""
+    if fmt == OutputFormat.parquet:
+        df.write_parquet(output_file if output_file else sys.stdout.buffer)
+    elif output_file:
+        df.write_csv(str(output_file), separator="\t")
+    else:
+        df.write_csv(sys.stdout.buffer, separator="\t", quote_style="never")
+
+
 def get_all_transcript_lengths(
     gtf_file: Path,
     output_file: Path | None = None,
-    gene_biotype: str = "protein_coding",
-):
+    gene_biotype: str | list[str] | None = "protein_coding",
+    cache_dir: Path | None = None,
+    refresh_cache: bool = False,
+    output_format: OutputFormat = OutputFormat.tsv,
+    merged_length: bool = False,
+    metrics: Metrics | None = None,
+) -> "pl.DataFrame":
     """
     Extract all transcripts with their lengths (sum of exon and UTRs) for each gene.
     Outputs one row per transcript: gene_id, transcript_id, transcript_length, gene_length, gene_name, chromosome, strand
+    If cache_dir is given, the parsed GTF is cached there as Arrow IPC and reused by later runs.
+
+    gene_biotype may be one biotype, a list of biotypes, or "all"/None for every biotype.
+    With more than one biotype the GTF is still parsed and grouped once: output_file is
+    a directory receiving one <biotype>.tsv/.parquet per biotype, and stdout gets a
+    single table with an extra gene_biotype column.
+
+    With merged_length, a merged_transcript_length column is added: the length of the
+    union of the exon/UTR intervals, so UTRs lying inside exons are not counted twice.
+
+    metrics, if given, receives the timings of the cache build, aggregate and write phases;
+    the GTF's size is credited to the phase that parses it.
     """
-    # Read GTF
-    df = read_gtf(str(gtf_file))
+    import polars as pl
+
+    metrics = metrics or Metrics()
+    biotypes = [gene_biotype] if isinstance(gene_biotype, str) else gene_biotype
+    if biotypes is not None and "all" in biotypes:
+        biotypes = None
+    single_biotype = biotypes is not None and len(biotypes) == 1
+
+    attributes = ["gene_id", "transcript_id", "gene_name", "gene_biotype"]
+    # lazy: the GTF (or its cached table) is only read by collect() in the aggregate phase
+    if cache_dir is None:
+        lf = scan_gtf(gtf_file, attributes)
+    else:
+        lf = cached_scan_gtf(gtf_file, attributes, cache_dir, refresh_cache, metrics)
 
     # Calculate gene length (span from min start to max end for each gene)
     gene_lengths = (
-        df.filter(pl.col("gene_id").is_not_null())
+        lf.filter(pl.col("gene_id").is_not_null())
         .group_by("gene_id")
         .agg([(pl.col("end").max() - pl.col("start").min() + 1).alias("gene_length")])
     )
 
-    # Features to include for transcript length
-    exonic_features = set(
-        f.lower() for f in ["exon", "five_prime_utr", "three_prime_utr", "3utr", "5utr"]
-    )
-
-    # Lowercase for filtering
-    df = df.with_columns(
-        pl.col("feature").cast(str).str.to_lowercase().alias("_feature_lc")
-    )
-    exons_utrs = df.filter(pl.col("_feature_lc").is_in(exonic_features))
+    exons_utrs = lf.filter(pl.col("feature").str.to_lowercase().is_in(EXONIC_FEATURES))
 
-    # Filter by gene_biotype if specified
-    if gene_biotype is not None:
-        if "gene_biotype" in exons_utrs.columns:
-            exons_utrs = exons_utrs.filter(pl.col("gene_biotype") == gene_biotype)
+    # Filter by gene_biotype if specified; files without the attribute (e.g. GENCODE) are
+    # kept whole, but in files that have it, rows lacking it (e.g. spike-ins) are dropped
+    if biotypes is not None:
+        exons_utrs = exons_utrs.filter(
+            pl.col("gene_biotype").is_in(biotypes)
+            | pl.col("gene_biotype").is_null().all()
+        )
 
     # Filter out rows with missing transcript_id or gene_id
     exons_utrs = exons_utrs.filter(
         pl.col("transcript_id").is_not_null() & pl.col("gene_id").is_not_null()
     )
 
-    if len(exons_utrs) == 0:
-        raise ValueError(
-            f"No exonic features found matching the criteria in {gtf_file}"
-        )
-
     # Calculate region length and remove bad
     exons_utrs = exons_utrs.with_columns(
         (pl.col("end") - pl.col("start") + 1).alias("region_length")
     ).filter(pl.col("region_length") > 0)
 
+    if merged_length:
+        # Sort-and-sweep: with intervals sorted by start, each one only adds the bases
+        # past the furthest end seen so far in its transcript
+        covered_end = (
+            pl.col("end").cum_max().shift(1).over("transcript_id", "gene_id")
+        )
+        new_start = pl.max_horizontal(pl.col("start"), covered_end + 1)
+        exons_utrs = exons_utrs.sort("transcript_id", "gene_id", "start").with_columns(
+            (pl.col("end") - new_start + 1).clip(lower_bound=0).alias("merged_region_length")
+        )
+
     # Sum region_length per transcript
     agg_exprs = [
         pl.col("region_length").sum().alias("transcript_length"),
         pl.col("seqname").first().alias("chromosome"),
         pl.col("strand").first().alias("strand"),
+        # Missing gene_name becomes an empty string
+        pl.col("gene_name").first().fill_null("").alias("gene_name"),
+        pl.col("gene_biotype").first().alias("gene_biotype"),
     ]
-
-    # Add gene_name if it exists
-    if "gene_name" in exons_utrs.columns:
-        agg_exprs.append(pl.col("gene_name").first().alias("gene_name"))
-    else:
-        agg_exprs.append(pl.lit("").alias("gene_name"))
+    if merged_length:
+        agg_exprs.append(
+            pl.col("merged_region_length").sum().alias("merged_transcript_length")
+        )
 
     trans_lengths = exons_utrs.group_by("transcript_id", "gene_id").agg(agg_exprs)
 
@@ -86,50 +254,110 @@ def get_all_transcript_lengths(
     trans_lengths = trans_lengths.join(gene_lengths, on="gene_id", how="left")
 
     # Sort by gene_id and transcript_length (descending)
-    result = trans_lengths.sort(
-        ["gene_id", "transcript_length", "transcript_id"],
-        descending=[False, True, False],
-    )
+    with metrics.phase("aggregate") as phase:
+        result = trans_lengths.sort(
+            ["gene_id", "transcript_length", "transcript_id"],
+            descending=[False, True, False],
+        ).collect()
+        phase.records = len(result)
+        if cache_dir is None:
+            phase.bytes = gtf_file.stat().st_size
+
+    if len(result) == 0:
+        raise ValueError(
+            f"No exonic features found matching the criteria in {gtf_file}"
+        )
 
     # Select and order columns
     outcols = [
         "gene_id",
         "transcript_id",
         "transcript_length",
+        "merged_transcript_length",
         "gene_length",
         "gene_name",
         "chromosome",
         "strand",
     ]
+    if not single_biotype:
+        outcols.insert(0, "gene_biotype")
     result = result.select([c for c in outcols if c in result.columns])
 
     # Output to file or stdout
-    if output_file:
-        result.write_csv(str(output_file), separator="\t")
-    else:
-        print("\t".join(result.columns))
-        for row in result.iter_rows(named=True):
-            print("\t".join(str(row.get(col, "")) for col in result.columns))
+    with metrics.phase("write", len(result)):
+        if single_biotype or output_file is None:
+            _write_table(result, output_file, output_format)
+        else:
+            output_file.mkdir(parents=True, exist_ok=True)
+            partitions = result.partition_by("gene_biotype", as_dict=True, include_key=False)
+            for (biotype,), part in partitions.items():
+                name = f"{biotype or 'unknown'}.{output_format.value}"
+                _write_table(part, output_file / name, output_format)
+
+    return result
 
 
 @app.command()
 def main(
     gtf_file: Path = typer.Argument(..., help="Path to the GTF file", exists=True),
     output: Path | None = typer.Option(
-        None, "--output", "-o", help="Output file path to save results as a TSV table"
+        None,
+        "--output",
+        "-o",
+        help="Output file path (a directory of per-biotype files when several biotypes are given)",
     ),
-    gene_biotype: str = typer.Option(
-        "protein_coding",
+    gene_biotype: list[str] = typer.Option(
+        ["protein_coding"],
         "--biotype",
         "-b",
-        help="Filter by gene biotype (default: protein_coding)",
+        help="Filter by gene biotype; repeat for several or use 'all' (default: protein_coding)",
+    ),
+    output_format: OutputFormat = typer.Option(
+        OutputFormat.tsv, "--format", "-f", help="Output format"
+    ),
+    merged_length: bool = typer.Option(
+        False,
+        "--merged-length",
+        help="Also report the union length of exon/UTR intervals (no double-counted UTRs)",
+    ),
+    cache_dir: Path | None = typer.Option(
+        None,
+        "--cache-dir",
+        envvar="TRANSCRIPT_LEN_CACHE_DIR",
+        help="Cache the parsed GTF as Arrow IPC in this directory and reuse it",
+    ),
+    refresh_cache: bool = typer.Option(
+        False, "--refresh-cache", help="Rebuild the cache entry for this GTF"
+    ),
+    prune_cache: bool = typer.Option(
+        False, "--prune-cache", help="Remove cache entries whose GTF is missing or changed"
+    ),
+    metrics_json: Path | None = typer.Option(
+        None, "--metrics-json", help="Write runtime and peak-memory metrics as JSON ('-' for stderr)"
+    ),
+    profile: Path | None = typer.Option(
+        None, "--profile", help="Write a cProfile dump of the main process (pstats format)"
     ),
 ):
     """
     Extract all transcripts with their lengths (sum of exonic and UTR parts) for all genes.
     Output includes: gene_id, transcript_id, transcript_length, gene_length, gene_name, chromosome, strand
     """
-    get_all_transcript_lengths(gtf_file, output, gene_biotype)
+    if prune_cache and cache_dir is not None and cache_dir.exists():
+        removed = prune_gtf_cache(cache_dir)
+        typer.echo(f"Pruned {removed} stale cache entries from {cache_dir}", err=True)
+    with Metrics("transcript-len", metrics_json, profile) as metrics:
+        result = get_all_transcript_lengths(
+            gtf_file,
+            output,
+            gene_biotype,
+            cache_dir,
+            refresh_cache,
+            output_format,
+            merged_length,
+            metrics,
+        )
+        metrics.records = len(result)
 
 
 if __name__ == "__main__":
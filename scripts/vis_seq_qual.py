@@ -1,7 +1,42 @@
-import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib.patches import Rectangle
-import matplotlib
+import csv
+import hashlib
+import json
+import os
+import shutil
+import typer
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from enum import Enum
+from functools import lru_cache
+from pathlib import Path
+from stat import S_ISREG
+
+from metrics import Metrics
+
+app = typer.Typer(context_settings={"help_option_names": ["-h", "--help"]})
+
+
+def set_publication_style(dpi=300):
+    """Publication mode settings shared by every figure."""
+    import matplotlib
+
+    matplotlib.rcParams.update(
+        {
+            "font.family": "sans-serif",
+            "font.sans-serif": ["Arial", "Helvetica", "DejaVu Sans"],
+            "font.size": 8,
+            "axes.labelsize": 9,
+            "axes.titlesize": 10,
+            "xtick.labelsize": 7,
+            "ytick.labelsize": 7,
+            "legend.fontsize": 7,
+            "figure.dpi": dpi,
+            "savefig.dpi": dpi,
+            "savefig.bbox": "tight",
+            "pdf.fonttype": 42,  # TrueType fonts (required by Nature)
+            "ps.fonttype": 42,
+        }
+    )
 
 
 def _plot_track_style(
@@ -23,6 +58,8 @@ def _plot_track_style(
     BASE_COLORS,
 ):
     """Track style with sequence above and quality track below."""
+    from matplotlib.patches import Rectangle
+
     seq_y = -y_offset
     qual_y = -y_offset - 0.85
 
@@ -93,6 +130,181 @@ def _plot_track_style(
         )
 
 
+def _rect_vertices(x0, y0, width, height):
+    """Vertices of axis-aligned rectangles as an (n, 4, 2) array for PolyCollection."""
+    import numpy as np
+
+    x0, y0, width, height = np.broadcast_arrays(x0, y0, width, height)
+    x1, y1 = x0 + width, y0 + height
+    corners = [(x0, y0), (x1, y0), (x1, y1), (x0, y1)]
+    return np.stack([np.stack(corner, axis=-1) for corner in corners], axis=1)
+
+
+@lru_cache(maxsize=None)
+def _base_glyph(base, font_size):
+    """
+    Outline of one monospace letter in points, centered like ``ax.text(ha="center", va="center")``.
+
+    Laid out once per (letter, size) and reused for every occurrence of the base.
+    """
+    from matplotlib.font_manager import FontProperties
+    from matplotlib.textpath import TextPath, text_to_path
+    from matplotlib.transforms import Affine2D
+
+    prop = FontProperties(family="monospace", size=font_size)
+    width, _h, _d = text_to_path.get_text_width_height_descent(base, prop, ismath=False)
+    # matplotlib centers single-line text on a box sized by the "lp" line metrics
+    _w, line_height, line_descent = text_to_path.get_text_width_height_descent(
+        "lp", prop, ismath=False
+    )
+    path = TextPath((0, 0), base, prop=prop)
+    return path.transformed(Affine2D().translate(-width / 2, line_descent - line_height / 2))
+
+
+def _plot_letter_glyphs(ax, letters, x, y, colors, font_size):
+    """
+    Draw letters as cached glyph outlines placed at data coordinates (x, y).
+
+    One PathCollection per (letter, color) holds a single glyph path repeated at
+    many offsets, so vector backends write each glyph once and reference it.
+    """
+    import numpy as np
+    from matplotlib.collections import PathCollection
+    from matplotlib.colors import to_rgba_array
+    from matplotlib.transforms import Affine2D
+
+    codes = np.frombuffer(letters.encode(), dtype=np.uint8)
+    colors = to_rgba_array(colors)
+    # glyphs are in points: points -> inches -> pixels at draw/save dpi
+    glyph_transform = Affine2D().scale(1 / 72) + ax.figure.dpi_scale_trans
+    unique_colors, color_idx = np.unique(colors, axis=0, return_inverse=True)
+    for code in np.unique(codes):
+        for c, color in enumerate(unique_colors):
+            sel = (codes == code) & (color_idx.ravel() == c)
+            if not sel.any():
+                continue
+            ax.add_collection(
+                PathCollection(
+                    [_base_glyph(chr(code), font_size)],
+                    offsets=np.column_stack([x[sel], y[sel]]),
+                    offset_transform=ax.transData,
+                    transform=glyph_transform,
+                    facecolors=[color],
+                    edgecolors="none",
+                    zorder=10,
+                ),
+                autolim=False,
+            )
+
+
+def _plot_read_collections(
+    ax,
+    sequence,
+    quality,
+    adapter_mask,
+    wrap,
+    row_step,
+    letter_spacing,
+    base_width,
+    base_height,
+    sm,
+    qmin,
+    qmax,
+    font_size,
+    base_color_by_quality,
+    BASE_COLORS,
+    glyph_letters=False,
+):
+    """
+    Same drawing as ``_plot_track_style`` for the whole read, but each track is a
+    single PolyCollection built from NumPy arrays instead of one patch per base.
+    With ``glyph_letters`` the bases are drawn as cached glyph paths instead of text.
+    """
+    import numpy as np
+    from matplotlib.collections import PolyCollection
+    from matplotlib.colors import to_rgba_array
+
+    n = len(sequence)
+    idx = np.arange(n)
+    line, col = np.divmod(idx, wrap)
+    x_left = col * letter_spacing - base_width / 2
+    y_offset = 0.5 + line * row_step
+    seq_y = -y_offset
+    qual_y = -y_offset - 0.85
+
+    quality_rgba = sm.to_rgba(quality)
+
+    # Position bar below the quality track
+    ax.add_collection(
+        PolyCollection(
+            _rect_vertices(x_left, qual_y - 0.12, base_width, 0.08),
+            facecolors="lightgray",
+            edgecolors="none",
+            alpha=0.9,
+            zorder=2,
+        ),
+        autolim=False,
+    )
+
+    # Quality bars
+    if qmax > qmin:
+        bar_height = 0.5 * (quality - qmin) / (qmax - qmin)
+    else:
+        bar_height = np.full(n, 0.25)
+    ax.add_collection(
+        PolyCollection(
+            _rect_vertices(x_left, qual_y, base_width, bar_height),
+            facecolors=quality_rgba,
+            edgecolors="#CCCCCC",
+            linewidths=0.1,
+            alpha=0.85,
+            zorder=1,
+        ),
+        autolim=False,
+    )
+
+    # Letter backgrounds
+    if base_color_by_quality:
+        bg_colors = quality_rgba
+    else:
+        lut = np.zeros((256, 4))
+        for base, color in BASE_COLORS.items():
+            lut[ord(base)] = to_rgba_array(color)[0]
+        bg_colors = lut[np.frombuffer(sequence.encode(), dtype=np.uint8)]
+    ax.add_collection(
+        PolyCollection(
+            _rect_vertices(x_left, seq_y - base_height / 2, base_width, base_height),
+            facecolors=bg_colors,
+            edgecolors="#CCCCCC",
+            linewidths=0.2,
+            alpha=0.35 if base_color_by_quality else 0.9,
+            zorder=1,
+        ),
+        autolim=False,
+    )
+
+    normal_color = "black" if base_color_by_quality else "white"
+    if glyph_letters:
+        colors = np.where(adapter_mask[:, None], to_rgba_array("#D62728"), to_rgba_array(normal_color))
+        _plot_letter_glyphs(
+            ax, sequence, col * letter_spacing, seq_y - base_height / 16, colors, font_size
+        )
+        return
+
+    for i, base in enumerate(sequence):
+        ax.text(
+            col[i] * letter_spacing,
+            seq_y[i] - base_height / 16,
+            base,
+            fontsize=font_size,
+            color="#D62728" if adapter_mask[i] else normal_color,
+            ha="center",
+            va="center",
+            family="monospace",
+            zorder=10,
+        )
+
+
 def plot_sequence_with_quality(
     sequence,
     quality,
@@ -107,6 +319,19 @@ def plot_sequence_with_quality(
     BASE_WIDTH_RATIO=1,
     BASE_HEIGHT_RATIO=0.60,
     show_position=True,
+    renderer="collection",
+    glyph_letters=False,
+    lod=False,
+    lod_window=None,
+    lod_flank=50,
+    lod_threshold=5000,
+    quality_range=None,
+    colorbar=True,
+    position_offset=0,
+    apply_style=True,
+    save_to=None,
+    cache_dir=None,
+    cache_max_bytes=1 << 30,
     BASE_COLORS={
         "A": "#7C3AED",  # Dark purple/violet - distinct and colorblind-friendly
         "T": "#1E3A8A",  # Dark blue - good contrast
@@ -131,30 +356,70 @@ def plot_sequence_with_quality(
         letter_spacing (float): Spacing multiplier between bases.
         dpi (int): Resolution for export (300+ for publication).
         show_position (bool): If True, show start and end positions for each line (default: True).
+        renderer (str): 'collection' draws each track as one PolyCollection (fast, small PDFs);
+            'patches' draws one Rectangle per base as before.
+        glyph_letters (bool): With the collection renderer, draw bases as cached glyph outlines in
+            one PathCollection instead of one text object each. Much faster and smaller PDFs,
+            but letters are no longer editable text.
+        lod (bool or str): Level-of-detail mode for long reads: an overview of windowed mean quality
+            (rasterized) plus full letter tracks only within `lod_flank` bases of each adapter region.
+            'auto' enables it for reads longer than `lod_threshold` bases (default: False).
+            It creates its own multi-panel figure, so it cannot be combined with `ax`.
+        lod_window (int): Bases per quality bin in the overview (default: about 1000 bins per read).
+        lod_flank (int): Bases drawn in full on each side of an adapter region (default: 50).
+        quality_range (tuple or None): Fixed (qmin, qmax) for the quality colormap instead of the
+            read's 2nd-98th percentiles.
+        colorbar (bool): If True, add the quality colorbar (default: True).
+        position_offset (int): Added to the position labels, for plotting a slice of a read.
+        apply_style (bool): If True, apply the publication rcParams (skip when already set, e.g. in
+            batch workers).
+        save_to (str or Path or None): Save the figure here (format from the suffix).
+        cache_dir (str or Path or None): Opt-in render cache (requires `save_to`). Figures are stored
+            under a hash of the sequence, quality, adapter regions and every style argument; a hit
+            copies the stored file to `save_to` without rendering.
+        cache_max_bytes (int): Size budget of `cache_dir`; least recently used figures are evicted.
 
     Returns:
-        matplotlib.figure.Figure, matplotlib.axes.Axes
+        matplotlib.figure.Figure, matplotlib.axes.Axes ((None, None) on a render cache hit)
     """
-    # Publication mode settings (always enabled)
-    matplotlib.rcParams.update(
-        {
-            "font.family": "sans-serif",
-            "font.sans-serif": ["Arial", "Helvetica", "DejaVu Sans"],
-            "font.size": 8,
-            "axes.labelsize": 9,
-            "axes.titlesize": 10,
-            "xtick.labelsize": 7,
-            "ytick.labelsize": 7,
-            "legend.fontsize": 7,
-            "figure.dpi": dpi,
-            "savefig.dpi": dpi,
-            "savefig.bbox": "tight",
-            "pdf.fonttype": 42,  # TrueType fonts (required by Nature)
-            "ps.fonttype": 42,
-        }
-    )
+    params = dict(locals())
+    if save_to is not None or cache_dir is not None:
+        return _plot_and_save(params)
+
+    import matplotlib.pyplot as plt
+    import numpy as np
+
+    if apply_style:
+        set_publication_style(dpi)
     print(f"base_color_by_quality: {base_color_by_quality}")
 
+    if lod == "auto":
+        lod = len(sequence) > lod_threshold
+    if lod:
+        if ax is not None:
+            raise ValueError("Level-of-detail mode lays out its own figure; do not pass ax with lod")
+        return _plot_lod(
+            sequence,
+            quality,
+            adapter_regions,
+            wrap=wrap,
+            cmap=cmap,
+            dpi=dpi,
+            lod_window=lod_window,
+            lod_flank=lod_flank,
+            quality_range=quality_range,
+            base_color_by_quality=base_color_by_quality,
+            letter_spacing=letter_spacing,
+            BASE_FONT_SIZE=BASE_FONT_SIZE,
+            BASE_WIDTH_RATIO=BASE_WIDTH_RATIO,
+            BASE_HEIGHT_RATIO=BASE_HEIGHT_RATIO,
+            show_position=show_position,
+            renderer=renderer,
+            glyph_letters=glyph_letters,
+            BASE_COLORS=BASE_COLORS,
+            apply_style=False,
+        )
+
     if wrap is None:
         wrap = determine_wrap_len(sequence)
         print(f"Wrap length: {wrap}")
@@ -177,7 +442,7 @@ def plot_sequence_with_quality(
     # Calculate space needed for position labels (range style: start and end positions)
     pos_label_width = 0
     if show_position:
-        max_pos = n - 1
+        max_pos = position_offset + n - 1
         # Need symmetric space for start and end positions on both sides
         pos_label_width = len(str(max_pos)) * 0.15 + 0.4  # Same spacing on both sides
 
@@ -194,19 +459,39 @@ def plot_sequence_with_quality(
 
     ax.set_axis_off()
 
-    # Quality normalization with better range handling
-    qmin, qmax = np.percentile(quality, [2, 98])  # Robust to outliers
-    qrange = qmax - qmin
-    if qrange < 1:
-        qmin, qmax = quality.min(), quality.max()
-        qrange = qmax - qmin if qmax > qmin else 1
-
+    qmin, qmax = quality_range if quality_range else _quality_range(quality)
     norm = plt.Normalize(qmin, qmax)
     sm = plt.cm.ScalarMappable(norm=norm, cmap=cmap)
 
     y_offset = 0.5
     base_width = BASE_WIDTH_RATIO * letter_spacing
     base_height = BASE_HEIGHT_RATIO
+    row_step = line_height * 1.05  # Tight row spacing
+
+    if renderer == "collection":
+        adapter_mask = np.zeros(n, dtype=bool)
+        for start, end in adapter_regions:
+            adapter_mask[max(start, 0) : max(end, 0)] = True
+        _plot_read_collections(
+            ax,
+            sequence,
+            quality,
+            adapter_mask,
+            wrap,
+            row_step,
+            letter_spacing,
+            base_width,
+            base_height,
+            sm,
+            qmin,
+            qmax,
+            BASE_FONT_SIZE,
+            base_color_by_quality,
+            BASE_COLORS,
+            glyph_letters,
+        )
+    elif renderer != "patches":
+        raise ValueError(f"Unknown renderer: {renderer!r}")
 
     for i in range(n_lines):
         line_start = i * wrap
@@ -232,7 +517,7 @@ def plot_sequence_with_quality(
             ax.text(
                 -pos_label_width + 0.3,
                 pos_label_y,
-                f"{line_start + 1}",
+                f"{position_offset + line_start + 1}",
                 fontsize=BASE_FONT_SIZE - 3,
                 color="gray",
                 ha="right",
@@ -244,7 +529,7 @@ def plot_sequence_with_quality(
             ax.text(
                 end_x + pos_label_width - 0.3,  # Same distance as left label from bar
                 pos_label_y,
-                f"{line_end}",
+                f"{position_offset + line_end}",
                 fontsize=BASE_FONT_SIZE - 3,
                 color="gray",
                 ha="left",
@@ -253,26 +538,27 @@ def plot_sequence_with_quality(
                 zorder=10,
             )
 
-        _plot_track_style(
-            ax,
-            line_seq,
-            line_qual,
-            line_start,
-            adapter_regions,
-            y_offset,
-            letter_spacing,
-            base_width,
-            base_height,
-            sm,
-            qmin,
-            qmax,
-            is_in_adapter,
-            BASE_FONT_SIZE,
-            base_color_by_quality,
-            BASE_COLORS,
-        )
+        if renderer == "patches":
+            _plot_track_style(
+                ax,
+                line_seq,
+                line_qual,
+                line_start,
+                adapter_regions,
+                y_offset,
+                letter_spacing,
+                base_width,
+                base_height,
+                sm,
+                qmin,
+                qmax,
+                is_in_adapter,
+                BASE_FONT_SIZE,
+                base_color_by_quality,
+                BASE_COLORS,
+            )
 
-        y_offset += line_height * 1.05  # Tight row spacing
+        y_offset += row_step
 
     # Set limits with proper padding (symmetric spacing)
     max_line_length = min(wrap, n)
@@ -284,15 +570,228 @@ def plot_sequence_with_quality(
     ax.set_xlim(x_min, x_max)
     ax.set_ylim(-y_offset + 0.3, 0.8)  # Compact layout
 
-    # Publication-quality colorbar
+    if colorbar:
+        _add_quality_colorbar(fig, sm, ax, BASE_FONT_SIZE)
+        fig.tight_layout()
+    return fig, ax
+
+
+# Bump when a change to the drawing code alters figures for the same arguments
+_RENDER_CACHE_VERSION = 1
+
+
+def _render_cache_key(params, suffix):
+    """Hash of everything that determines a saved figure."""
+    import matplotlib
+    import numpy as np
+
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(f"{_RENDER_CACHE_VERSION}|{matplotlib.__version__}|{suffix}".encode())
+    digest.update(str(params["sequence"]).encode())
+    digest.update(np.asarray(params["quality"], dtype=float).tobytes())
+    for name, value in sorted(params.items()):
+        if name in ("sequence", "quality", "ax", "save_to", "cache_dir", "cache_max_bytes"):
+            continue
+        if isinstance(value, matplotlib.colors.Colormap):
+            value = value.name
+        digest.update(f"|{name}={value!r}".encode())
+    return digest.hexdigest()
+
+
+def _evict_render_cache(cache_dir, max_bytes):
+    """
+    Delete least recently used figures until the cache fits in `max_bytes`.
+
+    Batch workers share the cache, so in-flight `*.tmp` files of other processes are
+    left alone and entries that disappear while listing are skipped.
+    """
+    entries = []
+    for entry in Path(cache_dir).iterdir():
+        if entry.suffix == ".tmp":
+            continue
+        try:
+            stat = entry.stat()
+        except FileNotFoundError:
+            continue
+        if S_ISREG(stat.st_mode):
+            entries.append((stat, entry))
+    total = sum(stat.st_size for stat, _entry in entries)
+    for stat, entry in sorted(entries, key=lambda item: item[0].st_mtime):
+        if total <= max_bytes:
+            break
+        entry.unlink(missing_ok=True)
+        total -= stat.st_size
+
+
+def _plot_and_save(params):
+    """Render (or fetch from the render cache) and save a figure for plot_sequence_with_quality."""
+    save_to, cache_dir = params["save_to"], params["cache_dir"]
+    if save_to is None:
+        raise ValueError("cache_dir requires save_to")
+    inner = {**params, "save_to": None, "cache_dir": None}
+
+    if cache_dir is None:
+        fig, ax = plot_sequence_with_quality(**inner)
+        fig.savefig(save_to)
+        return fig, ax
+    if params["ax"] is not None:
+        raise ValueError("The render cache needs its own figure; do not pass ax with cache_dir")
+
+    suffix = Path(save_to).suffix
+    cache_dir = Path(cache_dir)
+    cached = cache_dir / f"{_render_cache_key(params, suffix)}{suffix}"
+    try:
+        os.utime(cached)  # mtime doubles as the LRU access time
+        shutil.copyfile(cached, save_to)
+        return None, None
+    except FileNotFoundError:
+        pass  # not cached yet, or just evicted by another worker
+
+    fig, ax = plot_sequence_with_quality(**inner)
+    fig.savefig(save_to)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    tmp = cached.with_name(f"{cached.name}.{os.getpid()}.tmp")
+    shutil.copyfile(save_to, tmp)
+    os.replace(tmp, cached)
+    _evict_render_cache(cache_dir, params["cache_max_bytes"])
+    return fig, ax
+
+
+def _quality_range(quality):
+    """Quality normalization with better range handling."""
+    import numpy as np
+
+    qmin, qmax = np.percentile(quality, [2, 98])  # Robust to outliers
+    if qmax - qmin < 1:
+        qmin, qmax = quality.min(), quality.max()
+    return qmin, qmax
+
+
+def _add_quality_colorbar(fig, sm, ax, font_size):
+    """Publication-quality colorbar."""
     cb = fig.colorbar(
         sm, ax=ax, orientation="vertical", fraction=0.04, pad=0.02, aspect=20
     )
-    cb.set_label("Base quality (Q score)", fontsize=BASE_FONT_SIZE + 1, labelpad=8)
-    cb.ax.tick_params(labelsize=BASE_FONT_SIZE - 1, width=0.5, length=3)
+    cb.set_label("Base quality (Q score)", fontsize=font_size + 1, labelpad=8)
+    cb.ax.tick_params(labelsize=font_size - 1, width=0.5, length=3)
     cb.outline.set_linewidth(0.5)
+    return cb
+
+
+def _lod_windows(adapter_regions, flank, n):
+    """Adapter regions widened by `flank` bases on each side, clipped and merged."""
+    windows = []
+    for start, end in sorted(adapter_regions):
+        start, end = max(0, start - flank), min(n, end + flank)
+        if start >= end:
+            continue
+        if windows and start <= windows[-1][1]:
+            windows[-1] = (windows[-1][0], max(windows[-1][1], end))
+        else:
+            windows.append((start, end))
+    return windows
+
 
-    fig.tight_layout()
+def _plot_lod(
+    sequence,
+    quality,
+    adapter_regions,
+    wrap,
+    cmap,
+    dpi,
+    lod_window,
+    lod_flank,
+    quality_range,
+    **detail_kwargs,
+):
+    """
+    Level-of-detail view of a long read.
+
+    Top: quality binned into `lod_window`-base means, drawn as one rasterized
+    PolyCollection, with adapter regions and the detailed windows marked.
+    Below: one full sequence/quality panel per adapter region (plus flank),
+    sharing the quality colormap of the whole read.
+    """
+    import matplotlib.pyplot as plt
+    import numpy as np
+    from matplotlib.collections import PolyCollection
+
+    sequence = str(sequence)
+    quality = np.array(quality, dtype=float)
+    n = len(sequence)
+    assert len(quality) == n, (
+        f"Quality array length ({len(quality)}) must match sequence length ({n})"
+    )
+    if lod_window is None:
+        lod_window = max(1, -(-n // 1000))
+
+    qmin, qmax = quality_range if quality_range else _quality_range(quality)
+    sm = plt.cm.ScalarMappable(norm=plt.Normalize(qmin, qmax), cmap=cmap)
+
+    # Windowed mean quality, padded with NaN so the last partial bin is averaged correctly
+    n_bins = -(-n // lod_window)
+    padded = np.full(n_bins * lod_window, np.nan)
+    padded[:n] = quality
+    binned = np.nanmean(padded.reshape(n_bins, lod_window), axis=1)
+    bin_start = np.arange(n_bins) * lod_window
+    bin_width = np.minimum(lod_window, n - bin_start)
+
+    windows = _lod_windows(adapter_regions, lod_flank, n)
+    detail_wraps = [wrap or determine_wrap_len(sequence[s:e]) for s, e in windows]
+    detail_heights = [
+        ((e - s + w - 1) // w) * 1.5 * 0.28 for (s, e), w in zip(windows, detail_wraps)
+    ]
+    overview_height = 0.8
+    fig = plt.figure(
+        figsize=(7.2, overview_height + sum(detail_heights)),
+        dpi=dpi,
+    )
+    grid = fig.add_gridspec(
+        1 + len(windows), 1, height_ratios=[overview_height] + detail_heights
+    )
+
+    ax = fig.add_subplot(grid[0])
+    heights = binned - qmin
+    ax.add_collection(
+        PolyCollection(
+            _rect_vertices(bin_start, 0, bin_width, heights),
+            facecolors=sm.to_rgba(binned),
+            edgecolors="none",
+            rasterized=True,
+        )
+    )
+    for start, end in adapter_regions:
+        ax.axvspan(start, end, color="#D62728", alpha=0.25, linewidth=0, zorder=0)
+    for start, end in windows:
+        ax.axvspan(start, end, ymin=0.95, ymax=1, color="gray", linewidth=0)
+    ax.set_xlim(0, n)
+    ax.set_ylim(min(0, np.nanmin(heights)), max(qmax - qmin, np.nanmax(heights)) * 1.1)
+    ax.set_yticks([])
+    for side in ("top", "right", "left"):
+        ax.spines[side].set_visible(False)
+    ax.set_xlabel(f"Position (bp, {lod_window} bp bins)")
+
+    detail_axes = []
+    for i, ((start, end), detail_wrap) in enumerate(zip(windows, detail_wraps)):
+        dax = fig.add_subplot(grid[i + 1])
+        plot_sequence_with_quality(
+            sequence[start:end],
+            quality[start:end],
+            [(s - start, e - start) for s, e in adapter_regions if s < end and e > start],
+            wrap=detail_wrap,
+            ax=dax,
+            cmap=cmap,
+            dpi=dpi,
+            quality_range=(qmin, qmax),
+            colorbar=False,
+            position_offset=start,
+            **detail_kwargs,
+        )
+        detail_axes.append(dax)
+
+    _add_quality_colorbar(
+        fig, sm, [ax] + detail_axes, detail_kwargs.get("BASE_FONT_SIZE", 8)
+    )
     return fig, ax
 
 def determine_wrap_len(sequence):
@@ -300,11 +799,182 @@ def determine_wrap_len(sequence):
 
     So that the sequence can be wrapped like a square.
     """
+    import numpy as np
+
     return int(np.sqrt(len(sequence) * 2))
 
 
-if __name__ == "__main__":
-    # Example usage
+class FigureFormat(str, Enum):
+    pdf = "pdf"
+    png = "png"
+    svg = "svg"
+
+
+class LodMode(str, Enum):
+    auto = "auto"
+    on = "on"
+    off = "off"
+
+
+_LOD_VALUES = {LodMode.auto: "auto", LodMode.on: True, LodMode.off: False}
+
+
+def read_adapter_regions(regions_file):
+    """
+    Read adapter regions from a TSV of `read_id<TAB>start<TAB>end`, one region per row.
+
+    A read may have several rows; a row with only a read id selects the read without
+    regions. Lines starting with '#' and a header row are skipped.
+    """
+    regions = defaultdict(list)
+    with open(regions_file, newline="") as f:
+        for row in csv.reader(f, delimiter="\t"):
+            if not row or row[0].startswith("#"):
+                continue
+            read_id = row[0]
+            if len(row) >= 3 and row[1].strip().isdigit() and row[2].strip().isdigit():
+                regions[read_id].append((int(row[1]), int(row[2])))
+            elif len(row) == 1 or not any(c.strip() for c in row[1:]):
+                regions[read_id]
+    return dict(regions)
+
+
+_WORKER_FASTQ = None
+
+
+def _init_batch_worker(fastq_file, dpi):
+    """Per-process setup: headless backend, shared styling and one indexed FASTQ handle."""
+    global _WORKER_FASTQ
+    import matplotlib
+    import pyfastx
+
+    matplotlib.use("Agg")
+    set_publication_style(dpi)
+    _WORKER_FASTQ = pyfastx.Fastq(str(fastq_file))
+
+
+def _render_read(read_id, adapter_regions, out_path, plot_kwargs):
+    import matplotlib.pyplot as plt
+
+    read = _WORKER_FASTQ[read_id]
+    fig, _ax = plot_sequence_with_quality(
+        read.seq,
+        read.quali,
+        adapter_regions,
+        apply_style=False,
+        save_to=out_path,
+        **plot_kwargs,
+    )
+    if fig is not None:
+        plt.close(fig)
+    return out_path
+
+
+@app.command()
+def batch(
+    fastq_file: Path = typer.Argument(..., exists=True, help="FASTQ(.gz) with the reads"),
+    regions_file: Path = typer.Argument(
+        ..., exists=True, help="TSV of read_id, start, end adapter regions"
+    ),
+    out_dir: Path = typer.Option(Path("."), "--out-dir", "-o", help="Output directory"),
+    fmt: FigureFormat = typer.Option(FigureFormat.pdf, "--format", "-f", help="Figure format"),
+    workers: int = typer.Option(
+        os.cpu_count() or 1, "--workers", "-w", min=1, help="Number of rendering processes"
+    ),
+    dpi: int = typer.Option(300, "--dpi"),
+    cmap: str = typer.Option("cividis", "--cmap"),
+    lod: LodMode = typer.Option(LodMode.auto, "--lod", help="Level-of-detail mode"),
+    glyph_letters: bool = typer.Option(
+        False, "--glyph-letters", help="Draw letters as cached glyph paths (not editable text)"
+    ),
+    force: bool = typer.Option(False, "--force", help="Re-render figures that are up to date"),
+    cache_dir: Path | None = typer.Option(
+        None, "--cache-dir", help="Content-addressed render cache shared across runs"
+    ),
+    cache_max_mb: int = typer.Option(1024, "--cache-max-mb", help="Render cache size budget"),
+    metrics_json: Path | None = typer.Option(
+        None, "--metrics-json", help="Write runtime and peak-memory metrics as JSON ('-' for stderr)"
+    ),
+    profile: Path | None = typer.Option(
+        None, "--profile", help="Write a cProfile dump of the main process (pstats format)"
+    ),
+):
+    """
+    Render sequence/quality figures for many reads in a process pool.
+
+    Reads are fetched by id through the pyfastx index. A figure is skipped when it is newer
+    than both the FASTQ and the regions file and was drawn with the same style options
+    (recorded in <out-dir>/.vis_seq_qual.<format>.json), unless --force is given.
+    """
+    import pyfastx
+
+    style = {
+        "version": _RENDER_CACHE_VERSION,
+        "dpi": dpi,
+        "cmap": cmap,
+        "lod": _LOD_VALUES[lod],
+        "glyph_letters": glyph_letters,
+    }
+    plot_kwargs = {
+        **{k: v for k, v in style.items() if k != "version"},
+        "cache_dir": cache_dir,
+        "cache_max_bytes": cache_max_mb << 20,
+    }
+    stamp = out_dir / f".vis_seq_qual.{fmt.value}.json"
+    with Metrics("vis-batch", metrics_json, profile) as metrics:
+        with metrics.phase("index") as phase:
+            regions = read_adapter_regions(regions_file)
+            out_dir.mkdir(parents=True, exist_ok=True)
+            # build the index once here so workers only load it
+            phase.records = len(pyfastx.Fastq(str(fastq_file)))
+
+        inputs_mtime = max(fastq_file.stat().st_mtime, regions_file.stat().st_mtime)
+        # figures drawn with other style options, or by an interrupted run, are stale
+        same_style = stamp.exists() and json.loads(stamp.read_text()) == style
+        tasks = []
+        for read_id, adapter_regions in regions.items():
+            out_path = out_dir / f"{read_id.replace('/', '_')}_seq_qual.{fmt.value}"
+            if (
+                not force
+                and same_style
+                and out_path.exists()
+                and out_path.stat().st_mtime >= inputs_mtime
+            ):
+                continue
+            tasks.append((read_id, adapter_regions, out_path, plot_kwargs))
+        stamp.unlink(missing_ok=True)
+
+        typer.echo(f"Rendering {len(tasks)} of {len(regions)} reads into {out_dir}...")
+        failed = 0
+        with metrics.phase("render") as phase:
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_init_batch_worker,
+                initargs=(fastq_file, dpi),
+            ) as pool:
+                futures = {pool.submit(_render_read, *task): task for task in tasks}
+                for future in as_completed(futures):
+                    read_id, _regions, out_path, _kwargs = futures[future]
+                    try:
+                        future.result()
+                    except Exception as e:
+                        failed += 1
+                        typer.echo(f"Failed to render {read_id}: {e}", err=True)
+                        # do not leave a figure of an older run that would pass as current
+                        out_path.unlink(missing_ok=True)
+            phase.records = metrics.records = len(tasks) - failed
+        stamp.write_text(json.dumps(style))
+    typer.echo(f"Rendered {len(tasks) - failed} figures, {failed} failed")
+    if failed:
+        raise typer.Exit(1)
+
+
+@app.command()
+def example():
+    """Render a small example read to vis_seq_qual.pdf."""
+    import matplotlib.pyplot as plt
+    import numpy as np
+
     sequence = "ATGCGATACGTTACGATCGATCGATAGCTGACGATGGGGGGGAATCGAAAAAATCGGGGG" * 2
     quality = np.random.randint(0, 60, size=len(sequence))
     adapter_regions = [(40, 60)]
@@ -318,4 +988,8 @@ if __name__ == "__main__":
         cmap="cividis",
         dpi=300,
     )
-    plt.savefig("vis_seq_qual.pdf", dpi=300)
\ No newline at end of file
+    plt.savefig("vis_seq_qual.pdf", dpi=300)
+
+
+if __name__ == "__main__":
+    app()